@@ -0,0 +1,54 @@
+# python internals
+from __future__ import annotations
+from typing import Iterator, Optional, Tuple
+import math
+# internal packages
+from .ntypes import *
+from .buffer import Scratch
+# external packages
+import numpy as np
+
+class BrickGrid:
+    def __init__(self, shape: Tuple[int, ...], size: int = 16) -> None:
+        if size <= 0:
+            raise ValueError("Rozmiar bloku musi być większy od 0")
+
+        self.__shape = tuple(shape)
+        self.__size = size
+        self.__starts = tuple(np.arange(0, dim, size) for dim in self.__shape)
+        self.__scratch = Scratch()
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.__shape
+    @property
+    def size(self) -> int:
+        return self.__size
+    @property
+    def counts(self) -> Tuple[int, ...]:
+        return tuple(math.ceil(dim / self.__size) for dim in self.__shape)
+    def reduce(self, val: NPArrayT, ufunc: np.ufunc = np.maximum) -> NPArrayT:
+        # the leading axis is reduced slab by slab into scratch of the thread, where reduceat would stride through the whole
+        # grid; bricks at the far faces may be partial, which both handle without padding the grid
+        slabs = self.__scratch(ufunc.__name__, (len(self.__starts[0]), *val.shape[1:]), val.dtype)
+        for slab, start in zip(slabs, self.__starts[0]):
+            ufunc.reduce(val[start:start + self.__size], axis=0, out=slab)
+        val = slabs
+        for axis, starts in enumerate(self.__starts[1:], 1):
+            val = ufunc.reduceat(val, starts, axis=axis)
+        return val
+    def stats(self, val: NPFArrayT, out: Optional[NPFArrayT] = None) -> NPFArrayT:
+        # the largest and the mean density of every brick, as a cheap signature of its content
+        out = np.empty((2, *self.counts), dtype=NPFloatT) if out is None else out
+        out[0] = self.reduce(val, np.maximum)
+        out[1] = self.reduce(val, np.add) / self.voxels()
+        return out
+    def voxels(self) -> NPArrayT:
+        sizes = [np.diff(np.append(starts, dim)) for starts, dim in zip(self.__starts, self.__shape)]
+        return np.multiply.outer(np.multiply.outer(sizes[0], sizes[1]), sizes[2])
+    def slices(self, index: Tuple[int, ...]) -> Tuple[slice, ...]:
+        return tuple(slice(i * self.__size, min((i + 1) * self.__size, dim)) for i, dim in zip(index, self.__shape))
+    def bricks(self, mask: NPBArrayT) -> Iterator[Tuple[slice, ...]]:
+        for index in zip(*np.nonzero(mask)):
+            yield self.slices(index)
+
+__all__ = ['BrickGrid']
@@ -1,11 +1,46 @@
 # python internals
 from __future__ import annotations
-from typing import Deque, Generic, TypeVar, Optional
+from typing import Any, Deque, Generic, TypeVar, Optional, Callable, Tuple, Dict
 from collections import deque
+import dataclasses
+import threading
+# internal packages
+from .ntypes import NPArrayT
 # external packages
+import numpy as np
 from PyQt6.QtCore import QObject, QMutex, QMutexLocker, pyqtSignal
 
 T = TypeVar("T")
+
+def _drop(buf: Deque[Tuple[Optional[int], Any]], due: Optional[int], free: Optional[Callable[[Any], None]] = None) -> int:
+    # frames keyed before the due one missed their time and are dropped instead of being shown late
+    dropped = 0
+    while due is not None and buf and buf[0][0] is not None and buf[0][0] < due:
+        _, value = buf.popleft()
+        if free is not None:
+            free(value)
+        dropped += 1
+    return dropped
+
+def _ready(buf: Deque[Tuple[Optional[int], Any]], due: Optional[int]) -> bool:
+    # frames keyed after the due one wait for their time, unkeyed ones are shown as soon as asked for
+    return bool(buf) and (due is None or buf[0][0] is None or buf[0][0] <= due)
+
+class Scratch:
+    def __init__(self) -> None:
+        # arrays reused by every frame computed on the calling thread, as several frames are computed at once
+        self.__local = threading.local()
+    def __getstate__(self) -> Dict[str, Any]:
+        return {}
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__local = threading.local()
+    def __call__(self, name: str, shape: Tuple[int, ...], dtype: np.dtype) -> NPArrayT:
+        arr = getattr(self.__local, name, None)
+        if arr is None or arr.shape != shape or arr.dtype != dtype:
+            arr = np.empty(shape, dtype=dtype)
+            setattr(self.__local, name, arr)
+        return arr
+
 class Buffer(QObject, Generic[T]):
     pushOccurred = pyqtSignal()
     popOccurred = pyqtSignal()
@@ -16,28 +51,112 @@ class Buffer(QObject, Generic[T]):
 
         super().__init__(parent)
         self.__mutex = QMutex()
-        self.__buf: Deque[T] = deque(maxlen=capacity)
+        self.__buf: Deque[Tuple[Optional[int], T]] = deque(maxlen=capacity)
+        self.__dropped: int = 0
     def __len__(self) -> int:
         with QMutexLocker(self.__mutex):
             return len(self.__buf)
     @property
     def capacity(self) -> int:
         return self.__buf.maxlen
-    def push(self, value: T) -> None:
+    @property
+    def dropped(self) -> int:
+        return self.__dropped
+    def push(self, value: T, key: Optional[int] = None) -> None:
+        with QMutexLocker(self.__mutex):
+            self.__buf.append((key, value))
+        self.pushOccurred.emit()
+    def pop(self, due: Optional[int] = None) -> Optional[T]:
+        with QMutexLocker(self.__mutex):
+            dropped = _drop(self.__buf, due)
+            self.__dropped += dropped
+            if not _ready(self.__buf, due):
+                value = None
+            else:
+                _, value = self.__buf.popleft()
+
+        if dropped or value is not None:
+            self.popOccurred.emit()
+        return value
+    def clear(self) -> None:
+        with QMutexLocker(self.__mutex):
+            self.__buf.clear()
+        self.clearOccurred.emit()
+
+class SlabBuffer(QObject, Generic[T]):
+    pushOccurred = pyqtSignal()
+    popOccurred = pyqtSignal()
+    clearOccurred = pyqtSignal()
+    def __init__(self, capacity: int, template: T, spare: int = 1, fields: Tuple[str, ...] = ('val',),
+                 allocate: Callable[[Tuple[int, ...], np.dtype], NPArrayT] = np.empty, parent: Optional[QObject] = None) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be > 0")
+        if spare <= 0:
+            raise ValueError("spare must be > 0")
+
+        super().__init__(parent)
+        self.__mutex = QMutex()
+        self.__capacity = capacity
+        self.__template = template
+
+        # frames being computed or drawn occupy slots of their own, besides the ones queued in the buffer
+        self.__slab: Dict[str, NPArrayT] = {}
+        for field in fields:
+            value = getattr(template, field)
+            self.__slab[field] = allocate((capacity + spare, *value.shape), value.dtype)
+        self.__free: Deque[int] = deque(range(capacity + spare))
+        self.__buf: Deque[Tuple[Optional[int], Tuple[int, T]]] = deque()
+        self.__held: Optional[int] = None
+        self.__dropped: int = 0
+    def __len__(self) -> int:
         with QMutexLocker(self.__mutex):
-            self.__buf.append(value)
+            return len(self.__buf)
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+    @property
+    def dropped(self) -> int:
+        return self.__dropped
+    @property
+    def slab(self) -> Dict[str, NPArrayT]:
+        return self.__slab
+    def slot(self, index: int) -> Dict[str, NPArrayT]:
+        return {field: slab[index] for field, slab in self.__slab.items()}
+    def frame(self, index: int) -> T:
+        return dataclasses.replace(self.__template, **self.slot(index))
+    def acquire(self) -> Optional[int]:
+        with QMutexLocker(self.__mutex):
+            return self.__free.popleft() if self.__free and len(self.__buf) < self.__capacity else None
+    def discard(self, index: int) -> None:
+        with QMutexLocker(self.__mutex):
+            self.__free.append(index)
+    def push(self, index: int, value: Optional[T] = None, key: Optional[int] = None) -> None:
+        with QMutexLocker(self.__mutex):
+            self.__buf.append((key, (index, self.frame(index) if value is None else value)))
         self.pushOccurred.emit()
-    def pop(self) -> Optional[T]:
+    def pop(self, due: Optional[int] = None) -> Optional[T]:
+        # the frame returned by the previous pop has been drawn by now, so its slot is free again
+        self.release()
         with QMutexLocker(self.__mutex):
-            if not self.__buf:
-                return None
-            value = self.__buf.popleft()
+            dropped = _drop(self.__buf, due, lambda entry: self.__free.append(entry[0]))
+            self.__dropped += dropped
+            if not _ready(self.__buf, due):
+                value = None
+            else:
+                _, (self.__held, value) = self.__buf.popleft()
 
-        self.popOccurred.emit()
+        if dropped or value is not None:
+            self.popOccurred.emit()
         return value
+    def release(self) -> None:
+        with QMutexLocker(self.__mutex):
+            if self.__held is not None:
+                self.__free.append(self.__held)
+                self.__held = None
     def clear(self) -> None:
         with QMutexLocker(self.__mutex):
+            self.__free.extend(index for _, (index, _) in self.__buf)
             self.__buf.clear()
         self.clearOccurred.emit()
 
-__all__ = ['Buffer']
\ No newline at end of file
+__all__ = ['Scratch', 'Buffer', 'SlabBuffer']
\ No newline at end of file
@@ -0,0 +1,165 @@
+# python internals
+from __future__ import annotations
+from typing import Callable, Hashable, Optional, NamedTuple
+from collections import OrderedDict
+import threading
+import hashlib
+import os
+# internal packages
+from .ntypes import NPArrayT
+# external packages
+import numpy as np
+
+def digest(arr: NPArrayT) -> str:
+    arr = np.ascontiguousarray(arr)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{arr.dtype.str}{arr.shape}".encode())
+    # the buffer of the array is hashed as it is, large grids are not copied into bytes first
+    h.update(memoryview(arr).cast('B'))
+    return h.hexdigest()
+
+class CacheStats(NamedTuple):
+    entries: int; nbytes: int; hits: int; misses: int
+
+class DiskCache:
+    def __init__(self, path: str, max_bytes: int) -> None:
+        if max_bytes < 0:
+            raise ValueError("Limit rozmiaru pamięci podręcznej musi być nieujemny")
+
+        os.makedirs(path, exist_ok=True)
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__hits: int = 0
+        self.__misses: int = 0
+    @property
+    def path(self) -> str:
+        return self.__path
+    @property
+    def max_bytes(self) -> int:
+        return self.__max_bytes
+    def __file(self, key: Hashable) -> str:
+        name = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.__path, f"{name}.npy")
+    def __files(self) -> list[os.DirEntry]:
+        return [entry for entry in os.scandir(self.__path) if entry.is_file() and entry.name.endswith('.npy')]
+    def load(self, key: Hashable) -> Optional[NPArrayT]:
+        file = self.__file(key)
+        with self.__lock:
+            try:
+                value = np.load(file, mmap_mode='r')
+                os.utime(file)
+            except FileNotFoundError:
+                self.__misses += 1
+                return None
+            except (OSError, ValueError):
+                self.__misses += 1
+                self.__remove(file)
+                return None
+            self.__hits += 1
+        return value
+    def store(self, key: Hashable, value: NPArrayT) -> None:
+        if value.nbytes > self.__max_bytes:
+            return
+
+        file = self.__file(key)
+        tmp = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, value)
+        os.replace(tmp, file)
+
+        with self.__lock:
+            self.__evict()
+    def stats(self) -> CacheStats:
+        files = self.__files()
+        return CacheStats(len(files), sum(entry.stat().st_size for entry in files), self.__hits, self.__misses)
+    def clear(self) -> None:
+        with self.__lock:
+            for entry in self.__files():
+                self.__remove(entry.path)
+    def __evict(self) -> None:
+        files = sorted(self.__files(), key=lambda entry: entry.stat().st_mtime)
+        nbytes = sum(entry.stat().st_size for entry in files)
+        while nbytes > self.__max_bytes and files:
+            entry = files.pop(0)
+            nbytes -= entry.stat().st_size
+            self.__remove(entry.path)
+    @staticmethod
+    def __remove(file: str) -> None:
+        # files still memory-mapped by a running session cannot be removed on every platform
+        try:
+            os.remove(file)
+        except OSError: pass
+
+class BasisCache:
+    def __init__(self, budget: int) -> None:
+        if budget < 0:
+            raise ValueError("Budżet pamięci musi być nieujemny")
+
+        self.__lock = threading.Lock()
+        self.__entries: OrderedDict[Hashable, NPArrayT] = OrderedDict()
+        self.__budget: int = budget
+        self.__disk: Optional[DiskCache] = None
+        self.__nbytes: int = 0
+        self.__hits: int = 0
+        self.__misses: int = 0
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__entries)
+    def __contains__(self, key: Hashable) -> bool:
+        with self.__lock:
+            return key in self.__entries
+    @property
+    def budget(self) -> int:
+        return self.__budget
+    @budget.setter
+    def budget(self, value: int) -> None:
+        if value < 0:
+            raise ValueError("Budżet pamięci musi być nieujemny")
+
+        with self.__lock:
+            self.__budget = value
+            self.__evict()
+    @property
+    def disk(self) -> Optional[DiskCache]:
+        return self.__disk
+    @disk.setter
+    def disk(self, disk: Optional[DiskCache]) -> None:
+        self.__disk = disk
+    def stats(self) -> CacheStats:
+        with self.__lock:
+            return CacheStats(len(self.__entries), self.__nbytes, self.__hits, self.__misses)
+    def get(self, key: Hashable, factory: Callable[[], NPArrayT]) -> NPArrayT:
+        with self.__lock:
+            if key in self.__entries:
+                self.__hits += 1
+                self.__entries.move_to_end(key)
+                return self.__entries[key]
+            self.__misses += 1
+
+        disk = self.__disk
+        value = disk.load(key) if disk is not None else None
+        if value is None:
+            value = np.asarray(factory())
+            if disk is not None:
+                disk.store(key, value)
+        value.setflags(write=False)
+
+        with self.__lock:
+            if key not in self.__entries and value.nbytes <= self.__budget:
+                self.__entries[key] = value
+                self.__nbytes += value.nbytes
+                self.__evict()
+        return value
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__nbytes = 0
+    def __evict(self) -> None:
+        while self.__nbytes > self.__budget and self.__entries:
+            _, value = self.__entries.popitem(last=False)
+            self.__nbytes -= value.nbytes
+
+basis_cache = BasisCache(256 * 2**20)
+
+__all__ = ['digest', 'CacheStats', 'DiskCache', 'BasisCache', 'basis_cache']
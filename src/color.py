@@ -0,0 +1,136 @@
+# python internals
+from __future__ import annotations
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+import dataclasses
+# internal packages
+from .ntypes import *
+from .buffer import Scratch
+# external packages
+import numpy as np
+
+class ColorScale:
+    def __init__(self, value: float = 0.0, allocate: Callable[[Tuple[int, ...], np.dtype], NPArrayT] = np.empty) -> None:
+        # a single shared element, so worker threads and processes color against the same running maximum
+        self.__val = allocate((1,), np.float64)
+        self.__val[0] = value
+    @property
+    def value(self) -> float:
+        return float(self.__val[0])
+    def reset(self, value: float) -> None:
+        self.__val[0] = value
+    def update(self, value: float) -> float:
+        # the scale only grows, so an update lost to a concurrent one is made up for by the next larger frame
+        if value > self.__val[0]:
+            self.__val[0] = value
+        return self.value
+    @staticmethod
+    def curve(ratio: NPFArrayT) -> NPFArrayT:
+        # log-normalization of the density relative to the scale, so states normalized to another magnitude look the same
+        return np.log1p(ratio) / np.log(2.0)
+    def normalize(self, val: NPFArrayT) -> NPFArrayT:
+        return self.curve(np.maximum(val, 0.0) / self.value)
+
+class Colorizer:
+    # fields of a frame the colorizer fills in
+    fields: Tuple[str, ...] = ('color',)
+    def __init__(self, cmap: ColormapT, scale: ColorScale, alpha: Optional[float] = None, gamma: float = 0.4, dtype: np.dtype = NPFloatT,
+                 bins: int = 4096, cutoff: Optional[float] = None) -> None:
+        if bins <= 1:
+            raise ValueError("Liczba przedziałów tablicy kolorów musi być większa od 1")
+
+        self.__cmap = cmap
+        self.__scale = scale
+        self.__alpha = alpha
+        self.__gamma = gamma
+        self.__dtype = np.dtype(dtype)
+        self.__bins = bins
+        # fraction of the peak of a frame its values at or below stay transparent at, as in Scatter.masked
+        self.__cutoff = cutoff
+        self.__table: Optional[NPArrayT] = None
+        # bin indices and masks are scratch of the calling thread, as several frames are colored at once
+        self.__scratch = Scratch()
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_Colorizer__table'] = None
+        return state
+    @property
+    def bins(self) -> int:
+        return self.__bins
+    def table(self) -> NPArrayT:
+        # normalization, gamma, colormap and alpha fused into one table over [0, 1] of the density relative to the scale,
+        # so it never has to be rebuilt; bins start at their left edge, so empty space stays exactly transparent
+        if self.__table is not None:
+            return self.__table
+
+        v_norm = ColorScale.curve(np.arange(self.__bins) / (self.__bins - 1))
+        rgba = self.__cmap.map(v_norm ** self.__gamma, mode='float')
+        rgba[:, 3] = 1.0 if self.__alpha is None else v_norm ** self.__alpha
+        if self.__dtype == NPUintT:
+            rgba *= 255
+
+        self.__table = np.ascontiguousarray(rgba, dtype=self.__dtype)
+        return self.__table
+    def __call__(self, val: NPFArrayT, out: Optional[NPArrayT] = None) -> NPArrayT:
+        peak = float(np.max(val))
+        scale = self.__scale.update(peak)
+        lut = self.table()
+
+        index = self.__scratch('index', val.shape, np.dtype(np.intp))
+        np.multiply(val, (self.__bins - 1) / scale if scale > 0.0 else 0.0, out=index, casting='unsafe')
+
+        if out is None:
+            out = np.empty((*val.shape, 4), dtype=self.__dtype)
+        # negative values truncate to the first bin and values above the scale are clipped to the last one
+        np.take(lut, index, axis=0, out=out, mode='clip')
+        if self.__cutoff is not None:
+            # a fixed point set holds points under the cutoff of the frame, which per-frame masking would have left out
+            hidden = np.less_equal(val, peak * self.__cutoff, out=self.__scratch('hidden', val.shape, np.dtype(bool)))
+            np.copyto(out[..., 3], 0, where=hidden)
+        return out
+    def frame(self, frame: Union[Scatter, Volume], color: Optional[NPArrayT] = None) -> Union[Scatter, Volume]:
+        return dataclasses.replace(frame, color=self(frame.val, color))
+
+class DensityEncoder:
+    fields: Tuple[str, ...] = ('color', 'vmax')
+    def __init__(self, scale: ColorScale, dtype: np.dtype = np.float16) -> None:
+        if np.dtype(dtype) not in (np.dtype(np.float16), np.dtype(NPUintT)):
+            raise ValueError("Gęstości mogą być kodowane tylko jako float16 lub uint8")
+
+        self.__scale = scale
+        self.__dtype = np.dtype(dtype)
+        self.__scratch = Scratch()
+    def __call__(self, val: NPFArrayT, scale: float, out: Optional[NPArrayT] = None) -> NPArrayT:
+        # densities relative to the scale, in [0, 1] as float16 or in [0, 255] as uint8 normalized back by the GPU,
+        # so they keep their precision however small the densities of a state are
+        out = np.empty(val.shape, dtype=self.__dtype) if out is None else out
+        factor = (255.0 if self.__dtype == NPUintT else 1.0) / scale if scale > 0.0 else 0.0
+        if self.__dtype == NPUintT:
+            # rounded in a scratch of the thread, where slightly negative densities are clipped instead of wrapping around
+            tmp = self.__scratch('scaled', val.shape, val.dtype)
+            np.multiply(val, factor, out=tmp)
+            np.clip(tmp, 0.0, 255.0, out=tmp)
+            np.rint(tmp, out=tmp)
+            np.copyto(out, tmp, casting='unsafe')
+        else:
+            np.multiply(val, factor, out=out, casting='unsafe')
+        return out
+    def frame(self, frame: Volume, color: Optional[NPArrayT] = None, vmax: Optional[NPFArrayT] = None) -> Volume:
+        # encoded against the scale grown by the frame, which the frame carries along,
+        # so the scale growing further only changes a uniform of the shader
+        scale = self.__scale.update(float(np.max(frame.val)))
+        vmax = np.empty(1, dtype=NPFloatT) if vmax is None else vmax
+        vmax[0] = scale
+        return dataclasses.replace(frame, color=self(frame.val, scale, color), vmax=vmax)
+
+class FrameRenderer:
+    def __init__(self, func: Callable[..., Union[Scatter, Volume]], colorizer: Union[Colorizer, DensityEncoder]) -> None:
+        self.__func = func
+        self.__colorizer = colorizer
+    def __call__(self, arg: Any, val: Optional[NPFArrayT] = None, **out: NPArrayT) -> Union[Scatter, Volume]:
+        # keyword arguments are named after the frame fields, so buffer slots can be passed in as they are;
+        # the fields the colorizer fills in go to it, the rest to the frame function
+        encoded = {field: out.pop(field) for field in self.__colorizer.fields if field in out}
+        frame = self.__func(arg, out=val, **out)
+        return self.__colorizer.frame(frame, **encoded)
+
+__all__ = ['ColorScale', 'Colorizer', 'DensityEncoder', 'FrameRenderer']
@@ -0,0 +1,435 @@
+# python internals
+from __future__ import annotations
+from typing import Optional, List, Dict, Tuple
+# internal packages
+from .ntypes import *
+from .bricks import BrickGrid
+from .color import ColorScale, Colorizer
+# external packages
+from OpenGL import GL
+from OpenGL.GL import shaders
+from OpenGL.GL.ARB.texture_float import GL_LUMINANCE16F_ARB
+from PyQt6.QtGui import QOpenGLContext, QVector3D
+from PyQt6.QtOpenGL import QOpenGLBuffer
+from pyqtgraph.opengl.GLGraphicsItem import GLGraphicsItem
+from pyqtgraph.opengl import GLVolumeItem
+import numpy as np
+
+# shaders of legacy and core contexts differ only in the qualifiers of their inputs and outputs
+_VERTEX_SHADER = """
+    uniform mat4 u_mvp;
+    uniform float u_size;
+    {attribute} vec4 a_position;
+    {attribute} vec4 a_color;
+    {varying_out} vec4 v_color;
+    void main() {{
+        gl_Position = u_mvp * a_position;
+        gl_PointSize = u_size;
+        v_color = a_color;
+    }}
+"""
+
+# transparent points are discarded, as opaque blending would draw them as they are
+_FRAGMENT_SHADER = """
+    #ifdef GL_ES
+    precision mediump float;
+    #endif
+    {varying_in} vec4 v_color;
+    {output}
+    void main() {{
+        vec2 xy = (gl_PointCoord - 0.5) * 2.0;
+        if (dot(xy, xy) > 1.0 || v_color.a <= 0.0) discard;
+        {frag_color} = v_color;
+    }}
+"""
+
+_VOLUME_VERTEX_SHADER = """
+    uniform mat4 u_mvp;
+    {attribute} vec4 a_position;
+    {attribute} vec3 a_texcoord;
+    {varying_out} vec3 v_texcoord;
+    void main() {{
+        gl_Position = u_mvp * a_position;
+        v_texcoord = a_texcoord;
+    }}
+"""
+
+# texels hold densities relative to the range they were encoded against, rescaled to the current scale and looked up
+# in the table of the colorizer, which already holds the log-normalization, gamma, colormap and alpha
+_VOLUME_FRAGMENT_SHADER = """
+    #ifdef GL_ES
+    precision highp float;
+    #endif
+    uniform {sampler3D} u_volume;
+    uniform sampler2D u_cmap;
+    uniform float u_range;
+    uniform float u_cmap_size;
+    {varying_in} vec3 v_texcoord;
+    {output}
+    void main() {{
+        float t = clamp({texture3D}(u_volume, v_texcoord.zyx).r * u_range, 0.0, 1.0);
+        float x = (t * (u_cmap_size - 1.0) + 0.5) / u_cmap_size;
+        {frag_color} = {texture2D}(u_cmap, vec2(x, 0.5));
+    }}
+"""
+
+_LEGACY = dict(attribute='attribute', varying_out='varying', varying_in='varying', output='', frag_color='gl_FragColor',
+               sampler3D='sampler3D', texture3D='texture3D', texture2D='texture2D')
+_CORE = dict(attribute='in', varying_out='out', varying_in='in', output='out vec4 fragColor;', frag_color='fragColor',
+             sampler3D='highp sampler3D', texture3D='texture', texture2D='texture')
+
+def _sources(ctx: QOpenGLContext) -> Tuple[str, Dict[str, str]]:
+    version = ctx.format().version()
+    if ctx.isOpenGLES():
+        return ("#version 300 es\n", _CORE) if version >= (3, 0) else ("#version 100\n", _LEGACY)
+    return ("#version 140\n", _CORE) if version >= (3, 1) else ("#version 120\n", _LEGACY)
+
+def _compile(vertex: str, fragment: str, attributes: Tuple[str, ...]) -> int:
+    header, names = _sources(QOpenGLContext.currentContext())
+    # validation runs against the current state, where every sampler still points to the first texture unit
+    program = shaders.compileProgram(
+        shaders.compileShader([header, vertex.format(**names)], GL.GL_VERTEX_SHADER),
+        shaders.compileShader([header, fragment.format(**names)], GL.GL_FRAGMENT_SHADER),
+        validate=False
+    )
+    for loc, name in enumerate(attributes):
+        GL.glBindAttribLocation(program, loc, name)
+    GL.glLinkProgram(program)
+    return program
+
+class ScatterItem(GLGraphicsItem):
+    # compiled once per context, like the shaders of the pyqtgraph items
+    __programs: Dict[int, int] = {}
+    def __init__(self, pos: Optional[NPFArrayT] = None, color: Optional[NPArrayT] = None, size: float = 2.0,
+                 blending: str = 'translucent', parentItem: Optional[GLGraphicsItem] = None) -> None:
+        super().__init__(parentItem=parentItem)
+        self.setGLOptions(blending)
+
+        self.__pos: Optional[NPFArrayT] = None
+        self.__color: Optional[NPArrayT] = None
+        self.__size = size
+        self.__pos_dirty: bool = False
+        self.__color_dirty: bool = False
+
+        # positions are uploaded once, colors are streamed into the back one of two buffers every frame,
+        # so the driver never has to wait for the buffer the previous frame is still drawn from
+        self.__pos_vbo = QOpenGLBuffer(QOpenGLBuffer.Type.VertexBuffer)
+        self.__pos_vbo.setUsagePattern(QOpenGLBuffer.UsagePattern.StaticDraw)
+        self.__color_vbos: List[QOpenGLBuffer] = [QOpenGLBuffer(QOpenGLBuffer.Type.VertexBuffer) for _ in range(2)]
+        for vbo in self.__color_vbos:
+            vbo.setUsagePattern(QOpenGLBuffer.UsagePattern.StreamDraw)
+        self.__front: int = 0
+
+        if pos is not None:
+            self.set_positions(pos)
+        if color is not None:
+            self.set_colors(color)
+    @property
+    def pos(self) -> Optional[NPFArrayT]:
+        return self.__pos
+    @property
+    def size(self) -> float:
+        return self.__size
+    @size.setter
+    def size(self, value: float) -> None:
+        if value <= 0.0:
+            raise ValueError("Rozmiar punktów musi być większy od 0")
+        self.__size = value
+        self.update()
+    def set_blending(self, blending: str) -> None:
+        self.setGLOptions(blending)
+        self.update()
+    def set_positions(self, pos: NPFArrayT) -> None:
+        pos = np.ascontiguousarray(pos, dtype=np.float32)
+        if pos.ndim != 2 or pos.shape[1] != 3:
+            raise ValueError("Pozycje punktów muszą mieć kształt (N, 3)")
+
+        self.__pos = pos
+        self.__pos_dirty = True
+        self.update()
+    def set_colors(self, color: NPArrayT) -> None:
+        # uint8 colors are normalized by the GPU, anything else is uploaded as float32
+        if np.dtype(color.dtype) != NPUintT:
+            color = np.ascontiguousarray(color, dtype=np.float32)
+        color = np.ascontiguousarray(color).reshape((-1, 4))
+        if self.__pos is not None and color.shape[0] != self.__pos.shape[0]:
+            raise ValueError("Liczba kolorów nie odpowiada liczbie punktów")
+
+        # the array is only referenced until the next paint; frames of the buffer stay untouched until the next one arrives
+        self.__color = color
+        self.__color_dirty = True
+        self.update()
+    @staticmethod
+    def __upload(vbo: QOpenGLBuffer, arr: NPArrayT) -> None:
+        if not vbo.isCreated():
+            vbo.create()
+        vbo.bind()
+        if vbo.size() != arr.nbytes:
+            vbo.allocate(arr, arr.nbytes)
+        else:
+            vbo.write(0, arr, arr.nbytes)
+        vbo.release()
+    @classmethod
+    def __program(cls) -> int:
+        ctx = QOpenGLContext.currentContext()
+        key = id(ctx)
+        if key not in cls.__programs:
+            cls.__programs[key] = _compile(_VERTEX_SHADER, _FRAGMENT_SHADER, ("a_position", "a_color"))
+            # the id of a destroyed context is free to be taken by the next one
+            ctx.aboutToBeDestroyed.connect(lambda: cls.__programs.pop(key, None))
+        return cls.__programs[key]
+    def paint(self) -> None:
+        if self.__pos is None or self.__color is None:
+            return
+
+        self.setupGLState()
+
+        if self.__pos_dirty:
+            self.__upload(self.__pos_vbo, self.__pos)
+            self.__pos_dirty = False
+        if self.__color_dirty:
+            back = 1 - self.__front
+            self.__upload(self.__color_vbos[back], self.__color)
+            self.__front = back
+            self.__color_dirty = False
+
+        ctx = QOpenGLContext.currentContext()
+        if not ctx.isOpenGLES():
+            # point sprites are always on in core contexts, where enabling them is an error
+            fmt = ctx.format()
+            if fmt.profile() == fmt.OpenGLContextProfile.CompatibilityProfile or fmt.version() < (3, 0):
+                GL.glEnable(GL.GL_POINT_SPRITE)
+            GL.glEnable(GL.GL_PROGRAM_POINT_SIZE)
+
+        program = self.__program()
+
+        self.__pos_vbo.bind()
+        GL.glVertexAttribPointer(0, 3, GL.GL_FLOAT, False, 0, None)
+        self.__pos_vbo.release()
+
+        vbo = self.__color_vbos[self.__front]
+        vbo.bind()
+        if np.dtype(self.__color.dtype) == NPUintT:
+            GL.glVertexAttribPointer(1, 4, GL.GL_UNSIGNED_BYTE, True, 0, None)
+        else:
+            GL.glVertexAttribPointer(1, 4, GL.GL_FLOAT, False, 0, None)
+        vbo.release()
+
+        GL.glEnableVertexAttribArray(0)
+        GL.glEnableVertexAttribArray(1)
+        with program:
+            mvp = np.array(self.mvpMatrix().data(), dtype=np.float32)
+            GL.glUniformMatrix4fv(GL.glGetUniformLocation(program, "u_mvp"), 1, False, mvp)
+            GL.glUniform1f(GL.glGetUniformLocation(program, "u_size"), self.__size)
+            GL.glDrawArrays(GL.GL_POINTS, 0, self.__pos.shape[0])
+        GL.glDisableVertexAttribArray(0)
+        GL.glDisableVertexAttribArray(1)
+
+class VolumeItem(GLVolumeItem):
+    __programs: Dict[int, int] = {}
+    def __init__(self, data: NPArrayT, cmap: ColormapT, scale: float = 1.0, gamma: float = 0.4, alpha: float = 0.5,
+                 brick: int = 16, tolerance: float = 1 / 256, sliceDensity: int = 1, smooth: bool = True,
+                 glOptions: str = 'translucent', parentItem: Optional[GLGraphicsItem] = None) -> None:
+        self.__brick = brick
+        self.__tolerance = tolerance
+        self.__grid: Optional[BrickGrid] = None
+        self.__bricks: Optional[NPFArrayT] = None
+        self.__uploaded: Optional[NPFArrayT] = None
+        self.__occupied: Optional[NPBArrayT] = None
+        self.__range: float = 1.0
+        self.__scale: float = scale
+        self.__gamma = gamma
+        self.__alpha = alpha
+        self.__shape: Optional[Tuple[int, ...]] = None
+        self.__cmap_texture: Optional[int] = None
+        self.__lut: NPUArrayT = self.__table(cmap, gamma, alpha)
+        self.__lut_dirty: bool = True
+        super().__init__(data, sliceDensity=sliceDensity, smooth=smooth, glOptions=glOptions, parentItem=parentItem)
+    @property
+    def scale(self) -> float:
+        return self.__scale
+    def set_scale(self, scale: float) -> None:
+        # the scale is a uniform of the shader, so rescaling never touches the frames
+        if scale != self.__scale:
+            self.__scale = scale
+            self.update()
+    @staticmethod
+    def __table(cmap: ColormapT, gamma: float, alpha: float, points: int = 1024) -> NPUArrayT:
+        return Colorizer(cmap, ColorScale(), alpha=alpha, gamma=gamma, dtype=NPUintT, bins=points).table()
+    def set_colormap(self, cmap: ColormapT) -> None:
+        self.__lut = self.__table(cmap, self.__gamma, self.__alpha)
+        self.__lut_dirty = True
+        self.update()
+    def setData(self, data: NPArrayT, vmax: float = 1.0, bricks: Optional[NPFArrayT] = None) -> None:
+        # a single density channel per voxel relative to vmax, float16 in [0, 1] or uint8 standing for it,
+        # optionally with the statistics of its bricks the uploads are narrowed down with
+        if data.ndim != 3 or np.dtype(data.dtype) not in (np.dtype(np.float16), np.dtype(NPUintT)):
+            raise ValueError("Dane objętości muszą być trójwymiarową tablicą typu float16 lub uint8")
+
+        if self.__grid is None or self.__grid.shape != data.shape:
+            self.__grid = BrickGrid(data.shape, self.__brick)
+        if bricks is not None and bricks.shape != (2, *self.__grid.counts):
+            raise ValueError("Statystyki bloków nie odpowiadają kształtowi objętości")
+
+        if vmax < 0.0:
+            raise ValueError("Zakres gęstości nie może być ujemny")
+        # bricks that did not change still hold texels encoded against the previous range
+        if vmax != self.__range:
+            self.__uploaded = None
+        self.__range = vmax
+        self.__bricks = bricks
+        super().setData(np.ascontiguousarray(data))
+    def __formats(self) -> Tuple[int, int, int]:
+        ctx = QOpenGLContext.currentContext()
+        half = np.dtype(self.data.dtype) == np.dtype(np.float16)
+        if ctx.format().version() >= (3, 0):
+            return (GL.GL_R16F, GL.GL_RED, GL.GL_HALF_FLOAT) if half else (GL.GL_R8, GL.GL_RED, GL.GL_UNSIGNED_BYTE)
+        return (GL_LUMINANCE16F_ARB, GL.GL_LUMINANCE, GL.GL_HALF_FLOAT) if half else \
+            (GL.GL_LUMINANCE8, GL.GL_LUMINANCE, GL.GL_UNSIGNED_BYTE)
+    def __geometry(self) -> None:
+        # slices are cut only through the box around the bricks that ever held any density
+        shape = np.array(self.data.shape, dtype=np.float64)
+        nudge = 0.5 / shape
+        index = np.nonzero(self.__occupied)
+        lo = np.array([idx.min() * self.__brick if len(idx) else 0 for idx in index], dtype=np.float64)
+        hi = np.minimum([(idx.max() + 1) * self.__brick if len(idx) else 0 for idx in index], shape)
+        # two triangles per slice, between the corners of the box across the other two axes
+        corners = np.array([[0, 0], [1, 0], [0, 1], [1, 0], [1, 1], [0, 1]], dtype=bool)
+
+        vertices, count, self.lists = [], 0, {}
+        for ax in (0, 1, 2):
+            a, b = [i for i in (0, 1, 2) if i != ax]
+            w = np.linspace(lo[ax], hi[ax], max(2, int(hi[ax] - lo[ax]) * self.sliceDensity)) if hi[ax] > lo[ax] else np.empty(0)
+            for d in (-1, 1):
+                pos = np.empty((len(w), 6, 3))
+                pos[:, :, ax] = (w if d == 1 else w[::-1])[:, np.newaxis]
+                pos[:, :, a] = np.where(corners[:, 0], hi[a], lo[a])
+                pos[:, :, b] = np.where(corners[:, 1], hi[b], lo[b])
+                quads = np.concatenate([pos, nudge + pos / shape * (1 - 2 * nudge)], axis=-1).reshape(-1, 6)
+                self.lists[(ax, d)] = (count, len(quads))
+                vertices.append(quads)
+                count += len(quads)
+
+        pos = np.ascontiguousarray(np.concatenate(vertices), dtype=np.float32)
+        if not self.m_vbo_position.isCreated():
+            self.m_vbo_position.create()
+        self.m_vbo_position.bind()
+        self.m_vbo_position.allocate(pos, max(pos.nbytes, 1))
+        self.m_vbo_position.release()
+    def __changed(self) -> Optional[NPBArrayT]:
+        # bricks whose largest or mean density moved by more than the tolerance since they were last uploaded
+        if self.__bricks is None or self.__uploaded is None:
+            return None
+        return np.any(np.abs(self.__bricks - self.__uploaded) > self.__tolerance * self.__scale, axis=0)
+    def _uploadData(self) -> None:
+        if self.texture is None:
+            self.texture = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_3D, self.texture)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+
+        # the C-ordered (x, y, z) array is uploaded as it is, as a (z, y, x) texture swizzled back by the shader
+        internal, fmt, kind = self.__formats()
+        shape = self.data.shape
+        key = (*shape, internal)
+        new = key != self.__shape
+        changed = None if new else self.__changed()
+        if new:
+            filt = GL.GL_LINEAR if self.smooth else GL.GL_NEAREST
+            GL.glTexParameteri(GL.GL_TEXTURE_3D, GL.GL_TEXTURE_MIN_FILTER, filt)
+            GL.glTexParameteri(GL.GL_TEXTURE_3D, GL.GL_TEXTURE_MAG_FILTER, filt)
+            for wrap in (GL.GL_TEXTURE_WRAP_S, GL.GL_TEXTURE_WRAP_T, GL.GL_TEXTURE_WRAP_R):
+                GL.glTexParameteri(GL.GL_TEXTURE_3D, wrap, GL.GL_CLAMP_TO_EDGE)
+            GL.glTexImage3D(GL.GL_TEXTURE_3D, 0, internal, shape[2], shape[1], shape[0], 0, fmt, kind, self.data)
+            self.__occupied = np.zeros(self.__grid.counts, dtype=bool)
+            self.__shape = key
+        elif changed is None or np.count_nonzero(changed) * 2 > changed.size:
+            GL.glTexSubImage3D(GL.GL_TEXTURE_3D, 0, 0, 0, 0, shape[2], shape[1], shape[0], fmt, kind, self.data)
+        else:
+            # only bricks that changed noticeably are sent, empty bricks that stay empty never are
+            for sx, sy, sz in self.__grid.bricks(changed):
+                block = np.ascontiguousarray(self.data[sx, sy, sz])
+                GL.glTexSubImage3D(GL.GL_TEXTURE_3D, 0, sz.start, sy.start, sx.start, block.shape[2], block.shape[1], block.shape[0],
+                                   fmt, kind, block)
+        GL.glBindTexture(GL.GL_TEXTURE_3D, 0)
+
+        if self.__bricks is None:
+            self.__uploaded = None
+        elif changed is None or self.__uploaded is None:
+            self.__uploaded = np.array(self.__bricks)
+        else:
+            self.__uploaded[:, changed] = self.__bricks[:, changed]
+
+        # without statistics every brick may hold density
+        occupied = self.__occupied | (self.__bricks[0] > 0.0) if self.__bricks is not None else np.ones_like(self.__occupied)
+        if new or np.any(occupied != self.__occupied):
+            self.__occupied = occupied
+            self.__geometry()
+        self._needUpload = False
+    def __upload_colormap(self) -> None:
+        if self.__cmap_texture is None:
+            self.__cmap_texture = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.__cmap_texture)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        for param, value in ((GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR), (GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR),
+                             (GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE), (GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)):
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, param, value)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, self.__lut.shape[0], 1, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, self.__lut)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        self.__lut_dirty = False
+    @classmethod
+    def __program(cls) -> int:
+        ctx = QOpenGLContext.currentContext()
+        key = id(ctx)
+        if key not in cls.__programs:
+            cls.__programs[key] = _compile(_VOLUME_VERTEX_SHADER, _VOLUME_FRAGMENT_SHADER, ("a_position", "a_texcoord"))
+            ctx.aboutToBeDestroyed.connect(lambda: cls.__programs.pop(key, None))
+        return cls.__programs[key]
+    def paint(self) -> None:
+        if self.data is None:
+            return
+
+        if self._needUpload:
+            self._uploadData()
+        if self.__lut_dirty:
+            self.__upload_colormap()
+
+        self.setupGLState()
+
+        # slices are drawn back to front along the axis the camera looks down the most
+        cam = self.modelViewMatrix().inverted()[0].map(QVector3D()) - QVector3D(*[x / 2.0 for x in self.data.shape])
+        cam = np.array([cam.x(), cam.y(), cam.z()])
+        ax = int(np.argmax(np.abs(cam)))
+        offset, count = self.lists[(ax, 1 if cam[ax] > 0 else -1)]
+
+        program = self.__program()
+
+        self.m_vbo_position.bind()
+        GL.glVertexAttribPointer(0, 3, GL.GL_FLOAT, False, 6 * 4, None)
+        GL.glVertexAttribPointer(1, 3, GL.GL_FLOAT, False, 6 * 4, GL.GLvoidp(3 * 4))
+        self.m_vbo_position.release()
+
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_3D, self.texture)
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.__cmap_texture)
+
+        GL.glEnableVertexAttribArray(0)
+        GL.glEnableVertexAttribArray(1)
+        with program:
+            mvp = np.array(self.mvpMatrix().data(), dtype=np.float32)
+            GL.glUniformMatrix4fv(GL.glGetUniformLocation(program, "u_mvp"), 1, False, mvp)
+            GL.glUniform1i(GL.glGetUniformLocation(program, "u_volume"), 0)
+            GL.glUniform1i(GL.glGetUniformLocation(program, "u_cmap"), 1)
+            # an empty volume is encoded against a zero range
+            rescale = self.__range / max(self.__scale, self.__range) if self.__range > 0.0 else 0.0
+            GL.glUniform1f(GL.glGetUniformLocation(program, "u_range"), rescale)
+            GL.glUniform1f(GL.glGetUniformLocation(program, "u_cmap_size"), float(self.__lut.shape[0]))
+            GL.glDrawArrays(GL.GL_TRIANGLES, offset, count)
+        GL.glDisableVertexAttribArray(0)
+        GL.glDisableVertexAttribArray(1)
+
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_3D, 0)
+
+__all__ = ['ScatterItem', 'VolumeItem']
@@ -1,16 +1,20 @@
 # python internals
 from __future__ import annotations
+import os
 import sys
 import traceback
-from typing import Union, Optional, List
+import functools
+from typing import Callable, Union, Optional, List
 # internal packages
 from .stylesheet import stylesheet
 from .row import Row
 from .switch import ToggleSwitch
-from .ntypes import ColormapTypeT, SphDims, Scatter, Volume
+from .ntypes import ColormapTypeT, SphDims, EqualAreaDims, Scatter, Volume
 from .model import StateSpec, State, Atom, Plotter
+from .cache import DiskCache, basis_cache
 from .plot import WindowSpec, ScatterWindow, VolumeWindow
 from .scheduler import Scheduler
+from .quality import QualityController, LevelBuilder
 # external packages
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont, QImage, QIntValidator
@@ -34,6 +38,8 @@ class MainWindow(QWidget):
         self.__atom: Optional[Atom] = None
         self.__plot: Optional[Union[ScatterWindow, VolumeWindow]] = None
         self.__scheduler: Optional[Scheduler] = None
+        self.__quality: Optional[QualityController] = None
+        self.__levels: Optional[LevelBuilder] = None
         self.__rows: List[Row] = []
 
         self.__btn_snapshot = QPushButton("Zrzut ekranu")
@@ -78,6 +84,30 @@ class MainWindow(QWidget):
     def show_colorbar(self) -> bool:
         return self.__colorbar.isChecked()
     @property
+    def threads(self) -> int:
+        return int(self.__inp_threads.text())
+    @property
+    def budget(self) -> int:
+        return int(self.__inp_budget.text()) * 2**20
+    @property
+    def processes(self) -> bool:
+        return self.__processes.isChecked()
+    @property
+    def disk_cache(self) -> bool:
+        return self.__disk_cache.isChecked()
+    @property
+    def equal_area(self) -> bool:
+        return self.__equal_area.isChecked()
+    @property
+    def radial(self) -> str:
+        return 'probability' if self.__radial.isChecked() else 'uniform'
+    @property
+    def adaptive(self) -> bool:
+        return self.__adaptive.isChecked()
+    @property
+    def precision(self) -> str:
+        return 'double' if self.__double.isChecked() else 'single'
+    @property
     def plot_type(self) -> str:
         return 'volume' if self.__chk_vol.isChecked() else 'scatter'
     def take_snapshot(self) -> None:
@@ -143,6 +173,18 @@ class MainWindow(QWidget):
 
         form_layout.addRow(make_label("Rozmiar siatki przestrzennej:"), self.__inp_dim)
 
+        self.__inp_threads = QLineEdit(str(os.cpu_count() or 1))
+        self.__inp_threads.setValidator(QIntValidator(1, 256))
+        self.__inp_threads.setFixedWidth(80)
+
+        form_layout.addRow(make_label("Liczba wątków obliczeniowych:"), self.__inp_threads)
+
+        self.__inp_budget = QLineEdit("4096")
+        self.__inp_budget.setValidator(QIntValidator(256, 1048576))
+        self.__inp_budget.setFixedWidth(80)
+
+        form_layout.addRow(make_label("Budżet pamięci (MB):"), self.__inp_budget)
+
         self.__hud = QCheckBox()
         self.__hud.setChecked(True)
 
@@ -153,6 +195,36 @@ class MainWindow(QWidget):
 
         form_layout.addRow(make_label("Colorbar:"), self.__colorbar)
 
+        self.__processes = QCheckBox()
+        self.__processes.setChecked(False)
+
+        form_layout.addRow(make_label("Obliczenia w osobnych procesach:"), self.__processes)
+
+        self.__disk_cache = QCheckBox()
+        self.__disk_cache.setChecked(False)
+
+        form_layout.addRow(make_label("Pamięć podręczna na dysku:"), self.__disk_cache)
+
+        self.__equal_area = QCheckBox()
+        self.__equal_area.setChecked(True)
+
+        form_layout.addRow(make_label("Równopolowa siatka kątowa:"), self.__equal_area)
+
+        self.__radial = QCheckBox()
+        self.__radial.setChecked(True)
+
+        form_layout.addRow(make_label("Siatka radialna według gęstości:"), self.__radial)
+
+        self.__adaptive = QCheckBox()
+        self.__adaptive.setChecked(True)
+
+        form_layout.addRow(make_label("Adaptacyjna jakość:"), self.__adaptive)
+
+        self.__double = QCheckBox()
+        self.__double.setChecked(False)
+
+        form_layout.addRow(make_label("Obliczenia w podwójnej precyzji:"), self.__double)
+
         layout.addWidget(info_label)
         layout.addLayout(form_layout)
         layout.addSpacing(25)
@@ -270,42 +342,70 @@ class MainWindow(QWidget):
                 show_colorbar=self.show_colorbar
             )
 
-            plotter = Plotter(self.__atom,SphDims(self.dim,self.dim))
-
-            if self.plot_type == 'volume':
-                source = plotter.volume()
-                self.__plot = VolumeWindow(plot_spec)
-            else:
-                source = plotter.scatter()
-                self.__plot = ScatterWindow(plot_spec)
-
-            self.__plot.draw(source.val().masked())
-            self.__plot.show()
-
-            def callback(i: int) -> Union[Scatter,Volume]:
-                return source.val(i * self.speed).masked()
+            if not self.disk_cache:
+                basis_cache.disk = None
+            elif basis_cache.disk is None:
+                basis_cache.disk = DiskCache(os.path.join(os.path.expanduser("~"), ".cache", "wdmzf"), 4 * 2**30)
+
+            # coarser grid levels the quality controller falls back to
+            dims = [self.dim]
+            while self.adaptive and len(dims) < 4 and round(dims[-1] * 0.8) >= 20:
+                dims.append(round(dims[-1] * 0.8))
+            grid = EqualAreaDims if self.equal_area else SphDims
+
+            def frame_at(level: int) -> Callable[[float], Union[Scatter, Volume]]:
+                plotter = Plotter(self.__atom,grid(dims[level],dims[level]),mode='cross' if len(states) <= 4 else 'basis',budget=self.budget,radial=self.radial,precision=self.precision)
+                if self.plot_type == 'volume':
+                    return functools.partial(plotter.volume('native').val, masked=True)
+                return plotter.scatter(stable=True).val
+
+            # the full level is built right away, the coarser ones in the background while it is shown,
+            # so falling back to one never stalls the interface that is already short of time
+            if self.__levels is not None:
+                self.__levels.abort()
+                self.__levels.deleteLater()
+            self.__levels = LevelBuilder(frame_at, len(dims), parent=self)
+            levels = self.__levels
+            levels.build(0)
+
+            self.__plot = VolumeWindow(plot_spec) if self.plot_type == 'volume' else ScatterWindow(plot_spec)
 
             if self.__scheduler is not None:
                 self.__scheduler.abort()
 
-            self.__scheduler = self.__plot.auto_update(callback,self.fps)
+            if self.__quality is not None:
+                self.__quality.deleteLater()
+            # the cost of a level drops with the number of grid points, cubically with the grid size
+            self.__quality = QualityController(self.fps, len(dims), ratio=0.8 ** 3, parent=self)
+            quality = self.__quality
+            backend = 'process' if self.processes else 'thread'
+            offset = 0
+            shown = wanted = 0
+
+            def run(level: int, start: int) -> None:
+                nonlocal offset, shown
+
+                # the animation carries on from the frame it was at, on the grid of the new level
+                offset, shown = start, level
+                frame = levels[level]
+                self.__plot.draw(frame(offset * self.speed))
+                self.__scheduler = self.__plot.auto_update(frame,self.fps,self.threads,backend,lambda i: (offset + i) * self.speed,self.budget)
+                self.__scheduler.stepOccurred.connect(on_step)
 
-            fps_rec = []
             en_vals = dict(zip(((spec.n,spec.l,spec.m) for spec in self.__atom.specs),(state.energy_func().ev_val() for state in self.__atom.states)))
 
             def on_step(i: int) -> None:
-                nonlocal fps_rec,en_vals
-
-                current_fps = self.__scheduler.fps
-                fps_rec.append(current_fps)
-                if len(fps_rec) > self.fps:
-                    fps_rec.pop(0)
-                fps_avg = sum(fps_rec) / len(fps_rec) if fps_rec else 0.0
+                nonlocal en_vals
 
+                quality.observe(self.__plot.compute, self.__scheduler.jitter + self.__scheduler.present)
                 if self.show_hud:
                     self.__plot.set_hud(
                         f"speed:{self.speed:>15.2f}\n"
-                        f"fps:{fps_avg:>17.1f}\nspec:\n"
+                        f"fps:{self.__scheduler.fps:>17.1f}\n"
+                        f"jitter:{self.__scheduler.jitter * 1000:>11.1f} ms\n"
+                        f"dropped:{self.__scheduler.dropped:>12d}\n"
+                        f"missed:{self.__scheduler.missed:>13d}\n"
+                        f"quality:{f'{dims[shown]} ({quality.levels - shown}/{quality.levels})':>13}\nspec:\n"
                         + "\n".join(
                             f"{' ' * 5}({s.n},{s.l},{s.m}):\n"
                             f"{' ' * 7}en: {en_vals[(s.n,s.l,s.m)]:.4f} eV"
@@ -313,7 +413,24 @@ class MainWindow(QWidget):
                         )
                     )
 
-            self.__scheduler.stepOccurred.connect(on_step)
+            def switch() -> None:
+                # the closest level to the asked one that is built already, finer ones always are
+                level = min(wanted, levels.ready - 1)
+                if level != shown:
+                    run(level, offset + self.__scheduler.due())
+
+            def on_level(level: int) -> None:
+                nonlocal wanted
+                wanted = level
+                switch()
+
+            # levels change once the step that asked for it is over, as it tears down the scheduler running it
+            quality.levelChangeOccurred.connect(on_level, Qt.ConnectionType.QueuedConnection)
+            levels.levelReadyOccurred.connect(switch)
+            levels.errorOccurred.connect(lambda error: QMessageBox.critical(self,"Error",f"Nastąpił nieoczekiwany błąd: {error}"))
+            run(0, 0)
+            levels.start()
+            self.__plot.show()
 
         except ValueError as error:
             QMessageBox.warning(self,"Input Error",f"Nieprawidłowe dane wejściowe: {error}")
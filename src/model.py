@@ -1,14 +1,18 @@
 # python internals
 from __future__ import annotations
-from typing import Tuple, Union, Callable
+from typing import Tuple, Union, Callable, Optional, Iterator, Literal
+import copy
+import math
 # internal packages
 from .ntypes import *
+from .cache import digest, basis_cache
+from .planner import Planner, MemoryPlan
+from .bricks import BrickGrid
+from .buffer import Scratch
+from . import special
 # external packages
 import numpy as np
-from scipy.special import genlaguerre as laguerre
-from scipy.special import lpmv as legendre
-from scipy.special import factorial as fact
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import gaussian_filter, gaussian_filter1d
 from scipy.spatial import cKDTree
 
 class StateSpec:
@@ -37,6 +41,8 @@ class StateSpec:
         if not isinstance(other, StateSpec):
             return NotImplemented
         return self.__n == other.n and self.__l == other.l and self.__m == other.m
+    def __hash__(self) -> int:
+        return hash((self.__n, self.__l, self.__m))
     @property
     def n(self) -> int: return self.__n
     @property
@@ -54,22 +60,65 @@ class State:
     @property
     def spec(self) -> StateSpec:
         return self.__spec
-    def wave_func(self, p: SphPointsGrid) -> WaveFunction:
-        return WaveFunction(self, p)
+    def wave_func(self, p: SphAxes, precision: PrecisionT = 'single') -> WaveFunction:
+        return WaveFunction(self, p, precision)
     def energy_func(self) -> EnergyFunction:
         return EnergyFunction(self)
 
 class WaveFunction:
     scale = 1.0
-    def __init__(self, state: State, p: SphPointsGrid) -> None:
-        px = np.asarray(legendre(abs(state.spec.m), state.spec.l, np.cos(p.theta)), dtype=NPComplexT)
-        angle = (-1) ** abs(state.spec.m) * np.sqrt(((2*state.spec.l+1) * fact(state.spec.l - abs(state.spec.m))) / (4 * np.pi*fact(state.spec.l + abs(state.spec.m)))) * px * np.exp(1j*abs(state.spec.m)*p.phi)
-        la = np.asarray(laguerre(state.spec.n-state.spec.l-1, 2*state.spec.l+1)(2*p.r/(state.spec.n * self.scale)), dtype=NPFloatT)
-        radius = p.r ** state.spec.l * (2/(state.spec.n*self.scale)) ** (state.spec.l+1) * la * np.exp(-p.r / (state.spec.n*self.scale))
-        self.__init_val: NPCArrayT = radius * angle
-        self.__energy_func = state.energy_func()
-    def val(self, t: float = 0.0) -> NPCArrayT:
-        return self.__init_val*np.exp(-1j*self.__energy_func.val()*t)
+    # part of the cache keys of everything built from the factors, so caches on disk never serve factors of an older kind
+    revision = 2
+    def __init__(self, state: State, p: SphAxes, precision: PrecisionT = 'single') -> None:
+        self.__shape = p.shape
+        spec = state.spec
+        real, complex_ = Precision.of(precision)
+        self.__radial: NPFArrayT = basis_cache.get(self.__radial_key(spec, p.r, real), lambda: self.radial(spec, p.r, real))
+        self.__polar: NPFArrayT = basis_cache.get(self.__polar_key(spec, p.theta, real), lambda: self.polar(spec, p.theta, real))
+        self.__azimuthal: NPCArrayT = basis_cache.get(('azimuthal', abs(spec.m), digest(p.phi), np.dtype(complex_).str),
+                                                      lambda: self.azimuthal(spec, p.phi, complex_))
+    @classmethod
+    def __radial_key(cls, spec: StateSpec, r: NPFArrayT, dtype: np.dtype) -> Tuple:
+        return 'radial', cls.revision, spec.n, spec.l, cls.scale, digest(r), np.dtype(dtype).str
+    @staticmethod
+    def __polar_key(spec: StateSpec, theta: NPFArrayT, dtype: np.dtype) -> Tuple:
+        return 'polar', spec.l, abs(spec.m), digest(theta), np.dtype(dtype).str
+    @classmethod
+    def prefetch(cls, specs: Tuple[StateSpec, ...], p: SphAxes, precision: PrecisionT = 'single') -> None:
+        # factors of all states missing from the cache are evaluated together, in one pass of each recurrence
+        real = Precision.of(precision).real
+        radial = list({(spec.n, spec.l): spec for spec in specs if cls.__radial_key(spec, p.r, real) not in basis_cache}.values())
+        polar = list({(spec.l, abs(spec.m)): spec for spec in specs if cls.__polar_key(spec, p.theta, real) not in basis_cache}.values())
+        if radial:
+            for spec, val in zip(radial, cls.radials(radial, p.r, real)):
+                basis_cache.get(cls.__radial_key(spec, p.r, real), lambda: np.array(val))
+        if polar:
+            for spec, val in zip(polar, cls.polars(polar, p.theta, real)):
+                basis_cache.get(cls.__polar_key(spec, p.theta, real), lambda: np.array(val))
+    @classmethod
+    def radials(cls, specs: Tuple[StateSpec, ...], r: NPFArrayT, dtype: np.dtype = NPFloatT) -> NPFArrayT:
+        # the recurrences run in double precision on the axes alone, only their results are narrowed
+        val = special.radial([spec.n for spec in specs], [spec.l for spec in specs], r, cls.scale)
+        return np.asarray(val, dtype=dtype).reshape(len(specs), -1)
+    @staticmethod
+    def polars(specs: Tuple[StateSpec, ...], theta: NPFArrayT, dtype: np.dtype = NPFloatT) -> NPFArrayT:
+        val = special.legendre([spec.l for spec in specs], [abs(spec.m) for spec in specs], theta)
+        return np.asarray(val, dtype=dtype).reshape(len(specs), -1)
+    @classmethod
+    def radial(cls, spec: StateSpec, r: NPFArrayT, dtype: np.dtype = NPFloatT) -> NPFArrayT:
+        return cls.radials((spec,), r, dtype)[0]
+    @staticmethod
+    def polar(spec: StateSpec, theta: NPFArrayT, dtype: np.dtype = NPFloatT) -> NPFArrayT:
+        return WaveFunction.polars((spec,), theta, dtype)[0]
+    @staticmethod
+    def azimuthal(spec: StateSpec, phi: NPFArrayT, dtype: np.dtype = NPComplexT) -> NPCArrayT:
+        return np.asarray(np.exp(1j*abs(spec.m)*phi), dtype=dtype)
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.__shape
+    @property
+    def factors(self) -> Tuple[NPFArrayT, NPFArrayT, NPCArrayT]:
+        return self.__radial, self.__polar, self.__azimuthal
 
 class EnergyFunction:
     # physics constants
@@ -91,7 +140,7 @@ class EnergyFunction:
 
 class Atom:
     def __new__(cls, *args: State) -> Atom:
-        if any(args[i] == args[j] for i in range(len(args)) for j in range(i + 1, len(args))):
+        if len({state.spec for state in args}) != len(args):
             raise ValueError("Co najmniej dwa podane stany kwantowe są takie same")
         return super().__new__(cls)
     def __init__(self, *args: State) -> None:
@@ -106,72 +155,607 @@ class Atom:
     @property
     def specs(self) -> Tuple[StateSpec, ...]:
         return tuple(state.spec for state in self.__states)
-    def prob_func(self, p: SphPointsGrid) ->  ProbFunction:
-        return ProbFunction(self.__states, p)
+    def mirrors(self) -> Tuple[bool, bool, bool]:
+        # the density depends on phi only through e^{i(|m_j|-|m_k|)phi} and on the sign of cos(theta) through the parity of l+|m|
+        specs = self.specs
+        energies = tuple(state.energy_func().val() for state in self.__states)
+        x = y = z = True
+        for j in range(len(specs)):
+            for k in range(j + 1, len(specs)):
+                dm = abs(specs[j].m) - abs(specs[k].m)
+                static = energies[j] == energies[k]
+                x &= dm == 0 or static and dm % 2 == 0
+                y &= dm == 0 or static
+                z &= (specs[j].l + abs(specs[j].m) + specs[k].l + abs(specs[k].m)) % 2 == 0
+        return bool(x), bool(y), bool(z)
+    def axial(self) -> bool:
+        # with a single |m| the phases e^{i(|m_j|-|m_k|)phi} all vanish and the density is the same in every phi plane
+        return len({abs(spec.m) for spec in self.specs}) == 1
+    def prob_func(self, p: Union[SphAxes, SphPoints], mode: ProbModeT = 'direct', planner: Optional[Planner] = None,
+                  symmetric: bool = True, precision: PrecisionT = 'single') -> Union[ProbFunction, SymmetricProbFunction]:
+        # a frame of the cross terms reads a float per term and point, gathering through the fold costs about three of them
+        energies = [state.energy_func().val() for state in self.__states]
+        rows = 1 + 2 * sum(energies[j] != energies[k] for j in range(len(energies)) for k in range(j + 1, len(energies)))
+        if not symmetric or not isinstance(p, SphAxes) or mode == 'cross' and rows <= 3:
+            return ProbFunction(self.__states, p, mode, planner, precision)
+
+        # a grid is evaluated on its fundamental domain only: a single phi plane for axial densities and the theta <= pi/2
+        # half for densities mirrored in z, provided the polar axis is symmetric around the equator
+        r, theta, phi = p
+        itheta, iphi = np.arange(len(theta)), np.arange(len(phi))
+        if self.mirrors()[2] and np.allclose(theta + theta[::-1], np.pi):
+            itheta = np.minimum(itheta, len(theta) - 1 - itheta)
+            theta = theta[:(len(theta) + 1) // 2]
+        if self.axial():
+            iphi = np.zeros_like(iphi)
+            phi = phi[:1]
+        if len(theta) == p.theta.size and len(phi) == p.phi.size:
+            return ProbFunction(self.__states, p, mode, planner, precision)
+
+        planner = planner if planner is not None else Planner()
+        fold = planner.allocate(p.shape, np.intp)
+        plane = (itheta[:, np.newaxis] * len(phi) + iphi).ravel()
+        for sl in planner.chunks(len(r), fold[0].nbytes):
+            fold[sl] = (np.arange(sl.start, sl.stop)[:, np.newaxis] * (len(theta) * len(phi)) + plane).reshape(-1, *p.shape[1:])
+        return SymmetricProbFunction(ProbFunction(self.__states, SphAxes(r, theta, phi), mode, planner, precision), fold, planner)
 
 class ProbFunction:
-    def __init__(self, states: Tuple[State, ...], p: SphPointsGrid) -> None:
-        self.__wave_funcs = tuple(state.wave_func(p) for state in states)
-    def val(self, t: float = 0.0) -> NPFArrayT:
-        psi = np.sum(np.asarray(tuple(wave_fun.val(t) for wave_fun in self.__wave_funcs), dtype=NPComplexT), axis=0)
-        return np.abs(psi) ** 2
+    def __init__(self, states: Tuple[State, ...], p: Union[SphAxes, SphPoints], mode: ProbModeT = 'direct',
+                 planner: Optional[Planner] = None, precision: PrecisionT = 'single') -> None:
+        if mode not in ('direct', 'cross', 'basis'):
+            raise ValueError(f"Nieznany tryb obliczeń: '{mode}'")
+
+        self.__mode = mode
+        self.__real, self.__complex = Precision.of(precision)
+        self.__planner = planner if planner is not None else Planner()
+        self.__scratch = Scratch()
+        self.__index: Optional[Tuple[NPArrayT, NPArrayT, NPArrayT]] = None
+        if isinstance(p, SphPoints):
+            # scattered points are evaluated on the axes of their unique coordinates and gathered by index; both are found
+            # block by block, so no coordinate is ever sorted whole
+            self.__shape = (len(p.r),)
+            blocks = tuple(self.__planner.chunks(len(p.r), 3 * 16))
+            uniques = [np.empty(0, dtype=c.dtype) for c in p]
+            for sl in blocks:
+                uniques = [np.union1d(u, c[sl]) for u, c in zip(uniques, p)]
+            axes = SphAxes(*uniques)
+            self.__index = tuple(self.__planner.allocate(self.__shape, NPIntT) for _ in p)
+            for sl in blocks:
+                for index, u, c in zip(self.__index, uniques, p):
+                    index[sl] = np.searchsorted(u, c[sl])
+        else:
+            axes = p
+            self.__shape = p.shape
+        WaveFunction.prefetch(tuple(state.spec for state in states), axes, precision)
+        self.__wave_funcs = tuple(state.wave_func(axes, precision) for state in states)
+        self.__key = (tuple((state.spec.n, state.spec.l, state.spec.m) for state in states), WaveFunction.scale, WaveFunction.revision,
+                      type(p).__name__, digest(p.r), digest(p.theta), digest(p.phi))
+
+        energies = [state.energy_func().val() for state in states]
+        self.__energies = np.asarray(energies)
+        if mode == 'basis':
+            # energy-degenerate states evolve with the same phase, so they share one column of the basis
+            self.__groups = {energy: i for i, energy in enumerate(dict.fromkeys(energies))}
+        else:
+            self.__pairs = tuple((j, k) for j in range(len(energies)) for k in range(j + 1, len(energies)))
+            self.__dynamic = tuple((j, k) for j, k in self.__pairs if energies[j] != energies[k])
+            self.__freqs = np.asarray(tuple(energies[j] - energies[k] for j, k in self.__dynamic))
+
+        # precomputed arrays are built on first use, so masked copies never materialize them for the whole grid
+        self.__psi: Optional[NPCArrayT] = None
+        self.__terms: Optional[NPFArrayT] = None
+        self.__basis: Optional[NPCArrayT] = None
+    @property
+    def mode(self) -> ProbModeT:
+        return self.__mode
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.__real)
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.__shape))
+    @property
+    def __unit(self) -> int:
+        return 1 if self.__index is not None else self.__shape[1] * self.__shape[2]
+    def __chunks(self, row_bytes: int) -> Iterator[slice]:
+        return self.__planner.chunks(self.size, row_bytes, self.__unit)
+    def __outer(self, radial: NPArrayT, polar: NPArrayT, azimuthal: NPArrayT, sl: slice) -> NPArrayT:
+        if self.__index is None:
+            radial = radial[sl.start // self.__unit:sl.stop // self.__unit]
+            return np.multiply.outer(np.multiply.outer(radial, polar), azimuthal).ravel()
+        ir, itheta, iphi = self.__index
+        return radial[ir[sl]] * polar[itheta[sl]] * azimuthal[iphi[sl]]
+    def __cached(self, name: str, dtype: np.dtype, factory: Callable[[], NPArrayT]) -> NPArrayT:
+        if self.__key is None:
+            return factory()
+        return basis_cache.get((name, *self.__key, np.dtype(dtype).str), factory)
+    def __psi_matrix(self) -> NPCArrayT:
+        def psi() -> NPCArrayT:
+            val = self.__planner.allocate((len(self.__wave_funcs), self.size), self.__complex)
+            for sl in self.__chunks(len(val) * val.itemsize):
+                for k, wave_func in enumerate(self.__wave_funcs):
+                    val[k, sl] = self.__outer(*wave_func.factors, sl)
+            return val
+
+        if self.__psi is None:
+            self.__psi = self.__cached('psi', self.__complex, psi)
+        return self.__psi
+    def __basis_matrix(self) -> NPCArrayT:
+        def basis() -> NPCArrayT:
+            val = self.__planner.allocate((self.size, len(self.__groups)), self.__complex)
+            for sl in self.__chunks(val.shape[1] * val.itemsize):
+                val[sl] = 0.0
+                for energy, wave_func in zip(self.__energies.tolist(), self.__wave_funcs):
+                    val[sl, self.__groups[energy]] += self.__outer(*wave_func.factors, sl)
+            return val
+
+        if self.__basis is None:
+            self.__basis = self.__cached('basis', self.__complex, basis)
+        return self.__basis
+    def terms(self) -> NPFArrayT:
+        if self.__mode == 'basis':
+            raise RuntimeError("Rozkład gęstości na składowe nie jest dostępny w trybie 'basis'")
+
+        def terms() -> NPFArrayT:
+            # |sum psi_k e^{-iE_k t}|^2 = D + sum_{j<k} 2 Re(psi_j psi_k* e^{-i(E_j - E_k)t}), D being time independent
+            factors = tuple(wave_func.factors for wave_func in self.__wave_funcs)
+            rows = {pair: 1 + 2*i for i, pair in enumerate(self.__dynamic)}
+            val = self.__planner.allocate((1 + 2*len(rows), self.size), self.__real)
+            for sl in self.__chunks(len(val) * val.itemsize):
+                block = val[:, sl]
+                block[0] = 0.0
+                for radial, polar, azimuthal in factors:
+                    block[0] += self.__outer(radial ** 2, polar ** 2, np.abs(azimuthal) ** 2, sl)
+                for j, k in self.__pairs:
+                    radial = factors[j][0] * factors[k][0]
+                    polar = factors[j][1] * factors[k][1]
+                    azimuthal = factors[j][2] * np.conj(factors[k][2])
+                    if (j, k) in rows:
+                        block[rows[(j, k)]] = self.__outer(radial, polar, azimuthal.real, sl)
+                        block[rows[(j, k)] + 1] = self.__outer(radial, polar, azimuthal.imag, sl)
+                    else:
+                        block[0] += 2 * self.__outer(radial, polar, azimuthal.real, sl)
+            return val
+
+        if self.__terms is None:
+            self.__terms = self.__cached('cross', self.__real, terms)
+        return self.__terms
+    def coeffs(self, t: float = 0.0) -> NPFArrayT:
+        if self.__mode == 'basis':
+            raise RuntimeError("Rozkład gęstości na składowe nie jest dostępny w trybie 'basis'")
+
+        val = np.empty(1 + 2*len(self.__freqs), dtype=self.__real)
+        val[0] = 1.0
+        val[1::2] = 2 * np.cos(self.__freqs * t)
+        val[2::2] = 2 * np.sin(self.__freqs * t)
+        return val
+    def __phases(self, energies: NPArrayT, t: float) -> NPCArrayT:
+        return np.asarray(np.exp(-1j * energies * t), dtype=self.__complex)
+    def __wave_sum(self, t: float, sl: slice) -> NPCArrayT:
+        phases = self.__phases(self.__energies, t)
+        psi = np.zeros(sl.stop - sl.start, dtype=self.__complex)
+        for phase, (radial, polar, azimuthal) in zip(phases, (wave_func.factors for wave_func in self.__wave_funcs)):
+            psi += self.__outer(radial * phase, polar, azimuthal, sl)
+        return psi
+    def __bound(self, sl: slice) -> NPFArrayT:
+        # |sum psi_k|^2 <= (sum |psi_k|)^2 at every t, so points below the bound stay below it in every frame
+        val = np.zeros(sl.stop - sl.start, dtype=self.__real)
+        for radial, polar, azimuthal in (wave_func.factors for wave_func in self.__wave_funcs):
+            val += self.__outer(np.abs(radial), np.abs(polar), np.abs(azimuthal), sl)
+        return np.square(val, out=val)
+    def bound(self) -> NPFArrayT:
+        val = np.empty(self.size, dtype=self.__real)
+        for sl in self.__chunks(2 * val.itemsize):
+            val[sl] = self.__bound(sl)
+        return val.reshape(self.__shape)
+    def mask(self, cutoff: float) -> NPArrayT:
+        return np.concatenate([np.flatnonzero(self.__bound(sl) > cutoff) + sl.start for sl in self.__chunks(2 * np.dtype(self.__real).itemsize)])
+    def __floor(self, sl: slice) -> NPFArrayT:
+        # states of one energy keep their relative phase, so their sum keeps its magnitude g_e; the density never falls below
+        # (2 max_e g_e - sum_e g_e)^2, the largest group cancelled by all the others at once
+        groups = {}
+        for energy, (radial, polar, azimuthal) in zip(self.__energies.tolist(), (wave_func.factors for wave_func in self.__wave_funcs)):
+            psi = self.__outer(radial, polar, azimuthal, sl)
+            groups[energy] = psi if energy not in groups else groups[energy] + psi
+        magnitudes = [np.abs(psi) for psi in groups.values()]
+        val = 2 * np.maximum.reduce(magnitudes) - np.add.reduce(magnitudes)
+        return np.square(np.maximum(val, 0.0, out=val), out=val)
+    def floor(self) -> float:
+        # a lower bound of the peak density over every t
+        return max(float(np.max(self.__floor(sl))) for sl in self.__chunks(4 * np.dtype(self.__complex).itemsize))
+    def max(self, t: float = 0.0) -> float:
+        # evaluated block by block from the wave functions, so no precomputed array is built for it
+        return max(float(np.max(np.abs(self.__wave_sum(t, sl)))) ** 2 for sl in self.__chunks(2 * np.dtype(self.__complex).itemsize))
+    def masked(self, mask: NPArrayT) -> ProbFunction:
+        index = np.flatnonzero(mask) if mask.dtype == bool else np.asarray(mask)
+
+        masked = copy.copy(self)
+        masked.__scratch = Scratch()
+        masked.__shape = (len(index),)
+        masked.__key = None
+        # the gather index of the kept points is built block by block in the narrow index type
+        masked.__index = tuple(self.__planner.allocate((len(index),), NPIntT) for _ in range(3))
+        for sl in self.__planner.chunks(len(index), 3 * 16):
+            kept = np.unravel_index(index[sl], self.__shape) if self.__index is None else (i[index[sl]] for i in self.__index)
+            for i, k in zip(masked.__index, kept):
+                i[sl] = k
+
+        masked.__psi = None if self.__psi is None else np.ascontiguousarray(self.__psi[:, index])
+        masked.__terms = None if self.__terms is None else np.ascontiguousarray(self.__terms[:, index])
+        masked.__basis = None if self.__basis is None else np.ascontiguousarray(self.__basis[index])
+        return masked
+    def __blocks(self, row_bytes: int) -> Iterator[Tuple[slice, NPCArrayT]]:
+        # complex sums of a block go to scratch of the thread, sized by the first block, which is the largest one
+        block: Optional[NPCArrayT] = None
+        for sl in self.__chunks(row_bytes):
+            if block is None:
+                block = self.__scratch('block', (sl.stop - sl.start,), self.__complex)
+            yield sl, block[:sl.stop - sl.start]
+    def val(self, t: float = 0.0, out: Optional[NPFArrayT] = None) -> NPFArrayT:
+        out = np.empty(self.size, dtype=self.__real) if out is None else out.reshape(-1)
+        if self.__mode == 'cross':
+            coeffs, terms = self.coeffs(t), self.terms()
+            if Planner.mapped(terms):
+                for sl in self.__chunks(len(terms) * terms.itemsize):
+                    np.dot(coeffs, terms[:, sl], out=out[sl])
+            else:
+                # column blocks of the terms are strided, so in memory the product is taken at once to avoid copying them
+                np.dot(coeffs, terms, out=out)
+        elif self.__mode == 'basis':
+            phases, basis = self.__phases(np.asarray(tuple(self.__groups)), t), self.__basis_matrix()
+            for sl, block in self.__blocks(basis.shape[1] * basis.itemsize):
+                np.abs(np.matmul(basis[sl], phases, out=block), out=out[sl])
+        elif self.__index is not None:
+            phases, psi = self.__phases(self.__energies, t), self.__psi_matrix()
+            for sl, block in self.__blocks(len(psi) * psi.itemsize):
+                np.abs(np.matmul(phases, psi[:, sl], out=block), out=out[sl])
+        else:
+            for sl in self.__chunks(2 * len(self.__wave_funcs) * np.dtype(self.__complex).itemsize):
+                np.abs(self.__wave_sum(t, sl), out=out[sl])
+
+        if self.__mode != 'cross':
+            np.square(out, out=out)
+        return out.reshape(self.__shape)
+
+class SymmetricProbFunction:
+    def __init__(self, prob_func: ProbFunction, fold: NPArrayT, planner: Optional[Planner] = None) -> None:
+        # every point maps to a point of the fundamental domain the density is evaluated on, in the native index type so that
+        # gathering through it converts nothing in every frame
+        self.__prob_func = prob_func
+        self.__planner = planner if planner is not None else Planner()
+        self.__scratch = Scratch()
+        self.__shape = fold.shape
+        self.__fold = np.asarray(fold.ravel(), dtype=np.intp)
+    @property
+    def mode(self) -> ProbModeT:
+        return self.__prob_func.mode
+    @property
+    def dtype(self) -> np.dtype:
+        return self.__prob_func.dtype
+    @property
+    def size(self) -> int:
+        return len(self.__fold)
+    def terms(self) -> NPFArrayT:
+        terms = self.__prob_func.terms()
+        val = self.__planner.allocate((len(terms), self.size), terms.dtype)
+        for sl in self.__planner.chunks(self.size, 2 * val.itemsize * len(val)):
+            val[:, sl] = terms[:, self.__fold[sl]]
+        return val
+    def coeffs(self, t: float = 0.0) -> NPFArrayT:
+        return self.__prob_func.coeffs(t)
+    def bound(self) -> NPFArrayT:
+        return self.__prob_func.bound().ravel()[self.__fold].reshape(self.__shape)
+    def mask(self, cutoff: float) -> NPArrayT:
+        return np.flatnonzero((self.__prob_func.bound().ravel() > cutoff)[self.__fold])
+    def floor(self) -> float:
+        return self.__prob_func.floor()
+    def max(self, t: float = 0.0) -> float:
+        return self.__prob_func.max(t)
+    def masked(self, mask: NPArrayT) -> SymmetricProbFunction:
+        # only the points of the fundamental domain some kept point maps to are evaluated any longer
+        index = np.flatnonzero(mask) if mask.dtype == bool else np.asarray(mask)
+        used = np.zeros(self.__prob_func.size, dtype=bool)
+        for sl in self.__planner.chunks(len(index), 16):
+            used[self.__fold[index[sl]]] = True
+        remap = np.cumsum(used, dtype=np.intp) - 1
+        fold = self.__planner.allocate((len(index),), np.intp)
+        for sl in self.__planner.chunks(len(index), 16):
+            fold[sl] = remap[self.__fold[index[sl]]]
+        return SymmetricProbFunction(self.__prob_func.masked(used), fold, self.__planner)
+    def val(self, t: float = 0.0, out: Optional[NPFArrayT] = None) -> NPFArrayT:
+        out = np.empty(self.size, dtype=self.dtype) if out is None else out.reshape(-1)
+        val = self.__prob_func.val(t, self.__scratch('val', (self.__prob_func.size,), self.dtype))
+        np.take(val.ravel(), self.__fold, out=out, mode='clip')
+        return out.reshape(self.__shape)
 
 class Plotter:
-    def __init__(self, atom: Atom, dims: Union[SphDims, CartDims]) -> None:
+    def __init__(self, atom: Atom, dims: Union[SphDims, EqualAreaDims, CartDims], mode: ProbModeT = 'direct', budget: Optional[int] = None,
+                 radial: RadialT = 'uniform', rmax: Optional[float] = None, factor: float = 1e-4, precision: PrecisionT = 'single') -> None:
+        if radial not in ('uniform', 'probability'):
+            raise ValueError(f"Nieznany rozkład punktów radialnych: '{radial}'")
+
+        self.__atom = atom
         self.__dims = dims
+        self.__mode = mode
+        self.__planner = Planner(budget)
+        self.__precision = precision
+        self.__real = Precision.of(precision).real
+
+        # every state's radial factor times the largest magnitude of its polar one bounds its density on a shell
+        probe = np.linspace(0, 10 * max(spec.n for spec in atom.specs) ** 2, 4096)
+        theta = np.linspace(0, np.pi, 1024)
+        bounds = list(np.abs(WaveFunction.radials(atom.specs, probe, np.float64)) *
+                      np.max(np.abs(WaveFunction.polars(atom.specs, theta, np.float64)), axis=1, keepdims=True))
+        envelope = np.sum(bounds, axis=0) ** 2
 
-        rmax = 10 * max(spec.n for spec in atom.specs) ** 2
-        r = np.linspace(0, rmax, self.__sph_dims.r_dim)
-        theta = np.linspace(0, np.pi, self.__sph_dims.angle_dim)
-        phi = np.linspace(0, 2 * np.pi, self.__sph_dims.angle_dim)
-        self.__sph_grid: SphPointsGrid = SphPointsGrid(*(np.meshgrid(r, theta, phi, indexing='ij')), )
-        self.__cart_grid = CartPointsGrid(
-            self.__sph_grid.r * np.sin(self.__sph_grid.theta) * np.cos(self.__sph_grid.phi),
-            self.__sph_grid.r * np.sin(self.__sph_grid.theta) * np.sin(self.__sph_grid.phi),
-            self.__sph_grid.r * np.cos(self.__sph_grid.theta)
-        )
-        self.__val_func: ProbFunction = atom.prob_func(self.__sph_grid)
-    @property
-    def __sph_dims(self) -> SphDims:
-        return self.__dims if type(self.__dims) is SphDims else self.__dims.to_sph()
+        # the domain ends where the bound of the density drops under a tenth of the mask cutoff of the highest state
+        if rmax is None:
+            above = np.flatnonzero(envelope > factor * max(np.max(bound) ** 2 for bound in bounds))
+            rmax = probe[min(above[-1] + 1, len(probe) - 1)]
+        self.__rmax = float(rmax)
+
+        axes = self.__sph_dims.axes(self.__rmax)
+        if radial == 'probability':
+            # shells are equidistributed in a blend of the cumulative radial probability and of the radius itself, so half
+            # of them follow the density and no gap is ever wider than twice the uniform spacing
+            r = np.linspace(0, self.__rmax, 4096)
+            density = r ** 2 * np.interp(r, probe, envelope)
+            cdf = np.concatenate(([0.0], np.cumsum((density[1:] + density[:-1]) / 2)))
+            cdf = 0.5 * cdf / cdf[-1] + 0.5 * r / self.__rmax
+            axes = axes._replace(r=np.interp(axes.r / self.__rmax, cdf, r))
+        # the probe above is one-dimensional, the grid and everything derived from it is kept in the working precision
+        self.__sph_axes: SphAxes = SphAxes(*(np.asarray(axis, dtype=self.__real) for axis in axes))
+        self.__prob_func: Optional[Union[ProbFunction, SymmetricProbFunction]] = None
+    @property
+    def rmax(self) -> float:
+        return self.__rmax
+    @property
+    def __sph_dims(self) -> Union[SphDims, EqualAreaDims]:
+        return self.__dims.to_sph() if type(self.__dims) is CartDims else self.__dims
     @property
     def __cart_dims(self) -> CartDims:
         return self.__dims if type(self.__dims) is CartDims else self.__dims.to_cart()
-    def scatter(self) -> ScatterFunction:
-        return ScatterFunction(self.__cart_grid, self.__val_func.val)
-    def volume(self) -> VolumeFunction:
-        return VolumeFunction(self.__cart_grid, self.__val_func.val)
+    @property
+    def __val_func(self) -> Union[ProbFunction, SymmetricProbFunction]:
+        if self.__prob_func is None:
+            self.__prob_func = self.__atom.prob_func(self.__sph_axes, self.__fitting_mode('scatter'), self.__planner,
+                                                     precision=self.__precision)
+        return self.__prob_func
+    def __fitting_mode(self, output: Literal['scatter', 'volume']) -> ProbModeT:
+        # precomputed arrays that would not fit the budget are not built at all, the direct mode evaluates every frame
+        # block by block from the per-axis factors instead
+        return self.__mode if self.__planner.fits(self.plan(output)) else 'direct'
+    def plan(self, output: Literal['scatter', 'volume'] = 'scatter') -> MemoryPlan:
+        dims = self.__sph_dims if output == 'scatter' else self.__cart_dims
+        return Planner.estimate(dims, len(self.__atom.states), self.__mode, output, self.__precision)
+    def scatter(self, stable: bool = False) -> ScatterFunction:
+        return ScatterFunction(self.__sph_axes, self.__val_func, stable, precision=self.__precision)
+    def volume(self, resampler: ResamplerT = 'trilinear', backend: VolumeBackendT = 'gather', sigma: float = 0.6,
+               brick: Optional[int] = 16) -> VolumeFunction:
+        bricks = None if brick is None else BrickGrid(self.__cart_dims, brick)
+        if resampler == 'native':
+            return self.__native_volume(bricks)
+        return VolumeFunction(self.__sph_axes, self.__cart_dims, self.__val_func, resampler, backend, sigma, bricks=bricks,
+                              precision=self.__precision, planner=self.__planner)
+    def __native_volume(self, bricks: Optional[BrickGrid] = None, factor: float = 1e-4) -> VolumeFunction:
+        # mirror-symmetric densities are evaluated on the non-negative half of each symmetric axis only
+        axes, expand = [], []
+        for dim, mirror in zip(self.__cart_dims, self.__atom.mirrors()):
+            axis = np.linspace(-self.__rmax, self.__rmax, dim)
+            index = np.arange(dim)
+            if mirror:
+                index = np.maximum(index, dim - 1 - index) - dim // 2
+                axis = axis[dim // 2:]
+            axes.append(axis)
+            expand.append(index)
+
+        shape = tuple(len(axis) for axis in axes)
+        size, voxels = math.prod(shape), math.prod(self.__cart_dims)
+        axes = [np.asarray(axis, dtype=self.__real) for axis in axes]
+        blocks = lambda total, row_bytes, shape: ((sl, np.unravel_index(np.arange(sl.start, sl.stop), shape))
+                                                  for sl in self.__planner.chunks(total, row_bytes))
+
+        # coordinates are computed block by block from the point index, never as meshgrids of the whole grid
+        r, theta, phi = (self.__planner.allocate((size,), self.__real) for _ in range(3))
+        for sl, index in blocks(size, 96, shape):
+            x, y, z = (axis[i] for axis, i in zip(axes, index))
+            r[sl] = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+            theta[sl] = np.arccos(np.clip(np.divide(z, r[sl], out=np.ones_like(z), where=r[sl] > 0), -1.0, 1.0))
+            phi[sl] = np.mod(np.arctan2(y, x), 2 * np.pi)
+        prob_func = self.__atom.prob_func(SphPoints(r, theta, phi), self.__fitting_mode('volume'), self.__planner,
+                                          precision=self.__precision)
+        del r, theta, phi
+
+        # the expand index is kept in the native index type, so taking through it converts nothing in every frame
+        expanded = self.__planner.allocate((voxels,), np.intp)
+        for sl, (ix, iy, iz) in blocks(voxels, 64, self.__cart_dims):
+            ex, ey, ez = expand
+            expanded[sl] = (ex[ix] * shape[1] + ey[iy]) * shape[2] + ez[iz]
+        if bricks is not None:
+            # bricks where the bound of the density stays under a tenth of the volume cutoff of the first frame are never
+            # evaluated, their voxels gather the zero appended after the evaluated points
+            bound, val = prob_func.bound().ravel(), np.empty(voxels, dtype=self.__real)
+            for sl, _ in blocks(voxels, 16, self.__cart_dims):
+                np.take(bound, expanded[sl], out=val[sl])
+            active = bricks.reduce(val.reshape(self.__cart_dims)) > prob_func.max() * factor
+            del bound, val
+
+            kept = lambda index: active[tuple(i // bricks.size for i in index)]
+            used = np.zeros(prob_func.size, dtype=bool)
+            for sl, index in blocks(voxels, 64, self.__cart_dims):
+                used[expanded[sl][kept(index)]] = True
+            prob_func = prob_func.masked(used)
+            remap = np.cumsum(used, dtype=np.intp) - 1
+            for sl, index in blocks(voxels, 64, self.__cart_dims):
+                expanded[sl] = np.where(kept(index), remap[expanded[sl]], prob_func.size)
+
+        return VolumeFunction(None, self.__cart_dims, prob_func, 'native', expand=expanded, bricks=bricks, precision=self.__precision,
+                              planner=self.__planner)
 
 class ScatterFunction:
-    def __init__(self, grid: CartPointsGrid, val_func: Callable[[float], NPFArrayT]) -> None:
-        self.__grid = grid
-        self.__val_func = val_func
-    def val(self, t: float = 0.0) -> Scatter:
-        return Scatter(self.__grid.ravel(), self.__val_func(t).ravel())
+    def __init__(self, axes: SphAxes, prob_func: Union[ProbFunction, SymmetricProbFunction], stable: bool = False, factor: float = 0.001,
+                 precision: PrecisionT = 'single') -> None:
+        if stable:
+            # fixed point set: every point that can exceed the cutoff in any frame; the peak moves with t, so the cutoff
+            # is taken against a lower bound of it over every frame rather than against the first one
+            index = prob_func.mask(prob_func.floor() * factor)
+            self.__prob_func = prob_func.masked(index)
+        else:
+            index = np.arange(prob_func.size)
+            self.__prob_func = prob_func
+
+        # positions are computed for the kept points only, never for the whole grid
+        ir, itheta, iphi = np.unravel_index(index, axes.shape)
+        r, sin_theta = axes.r[ir], np.sin(axes.theta)[itheta]
+        self.__pos = np.empty((len(index), 3), dtype=Precision.of(precision).real)
+        self.__pos[:, 0] = r * sin_theta * np.cos(axes.phi)[iphi]
+        self.__pos[:, 1] = r * sin_theta * np.sin(axes.phi)[iphi]
+        self.__pos[:, 2] = r * np.cos(axes.theta)[itheta]
+        self.__pos.setflags(write=False)
+    @property
+    def pos(self) -> NPFArrayT:
+        return self.__pos
+    def val(self, t: float = 0.0, out: Optional[NPFArrayT] = None) -> Scatter:
+        return Scatter(self.__pos, self.__prob_func.val(t, out).ravel())
 
 class VolumeFunction:
-    def __init__(self, grid: CartPointsGrid, val_func: Callable[[float], NPFArrayT],) -> None:
-        self.__dims = CartDims(*grid.x.shape)
-        self.__val_func = val_func
+    def __init__(self, axes: Optional[SphAxes], dims: CartDims, prob_func: Union[ProbFunction, SymmetricProbFunction], resampler: ResamplerT = 'trilinear',
+                 backend: VolumeBackendT = 'gather', sigma: float = 0.6, expand: Optional[NPArrayT] = None,
+                 bricks: Optional[BrickGrid] = None, precision: PrecisionT = 'single', planner: Optional[Planner] = None) -> None:
+        self.__dims = dims
+        self.__real = Precision.of(precision).real
+        self.__planner = planner if planner is not None else Planner()
+        self.__scratch = Scratch()
+        self.__prob_func = prob_func
+        self.__sigma = sigma
+        self.__expand = expand
+        self.__bricks = bricks
+        self.__idx: Optional[NPArrayT] = None
+        self.__terms: Optional[NPFArrayT] = None
+
+        if resampler == 'native':
+            # the density is already evaluated on the voxels, so neither resampling nor smoothing is needed
+            return
+
+        if resampler == 'trilinear':
+            resample = lambda p: self.__trilinear(axes, p)
+        elif resampler == 'kdtree':
+            tree = cKDTree(np.column_stack(axes.to_cart().ravel()))
+            resample = lambda p: self.__kdtree(tree, p)
+        else:
+            raise ValueError(f"Nieznana metoda próbkowania: '{resampler}'")
+
+        # voxel centers are resampled block by block, only the corner indices and weights are kept for the whole grid; the
+        # indices in the native index type, so gathering through them converts nothing in every frame
+        rmax = axes.r[-1]
+        coords = tuple(np.linspace(-rmax, rmax, dim, dtype=self.__real) for dim in self.__dims)
+        size = math.prod(self.__dims)
+        self.__idx = self.__planner.allocate((size, 8), np.intp)
+        self.__w = self.__planner.allocate((size, 8), self.__real)
+        used = np.zeros(prob_func.size, dtype=bool)
+        for sl in self.__chunks(16 * (self.__idx.itemsize + self.__w.itemsize)):
+            index = np.unravel_index(np.arange(sl.start, sl.stop), self.__dims)
+            idx, self.__w[sl] = resample(CartPoints(*(coord[i] for coord, i in zip(coords, index))))
+            self.__idx[sl] = idx
+            used[idx.ravel()] = True
+
+        # only the spherical points referenced by some voxel are evaluated in every frame
+        self.__prob_func = prob_func.masked(used)
+        remap = np.cumsum(used, dtype=np.intp) - 1
+        for sl in self.__chunks(8 * self.__idx.itemsize):
+            self.__idx[sl] = remap[self.__idx[sl]]
+
+        if backend == 'operator' and prob_func.mode != 'basis':
+            self.__init_operator()
+        elif backend not in ('gather', 'operator'):
+            raise ValueError(f"Nieznany tryb obliczeń objętości: '{backend}'")
+    @property
+    def bricks(self) -> Optional[BrickGrid]:
+        return self.__bricks
+    def __chunks(self, row_bytes: int) -> Iterator[slice]:
+        return self.__planner.chunks(math.prod(self.__dims), row_bytes)
+    def __init_operator(self) -> None:
+        # interpolation and smoothing are both linear, so they are applied once to every time-independent density term
+        terms = self.__prob_func.terms()
+        self.__terms = self.__planner.allocate((len(terms), math.prod(self.__dims)), self.__real)
+        val = np.empty(self.__dims, dtype=self.__real)
+        for i, term in enumerate(terms):
+            self.__resample(term, val.reshape(-1))
+            gaussian_filter(val, sigma=self.__sigma, output=self.__terms[i].reshape(self.__dims))
+    def __resample(self, val: NPFArrayT, out: NPFArrayT) -> None:
+        # every voxel is the weighted sum of its eight corners, gathered block by block into scratch of the largest block
+        blocks = tuple(self.__chunks(16 * (self.__idx.itemsize + self.__w.itemsize)))
+        corners = self.__scratch('corners', (blocks[0].stop if blocks else 0, 8), val.dtype)
+        for sl in blocks:
+            block = corners[:sl.stop - sl.start]
+            np.take(val, self.__idx[sl], out=block, mode='clip')
+            np.einsum('ij,ij->i', block, self.__w[sl], out=out[sl])
+    @staticmethod
+    def __locate(axis: NPFArrayT, val: NPFArrayT) -> Tuple[NPArrayT, NPFArrayT]:
+        i = np.clip(np.searchsorted(axis, val, side='right') - 1, 0, len(axis) - 2)
+        w = np.clip((val - axis[i]) / (axis[i + 1] - axis[i]), 0.0, 1.0)
+        return i, w
+    @classmethod
+    def __trilinear(cls, axes: SphAxes, p: CartPoints) -> Tuple[NPArrayT, NPFArrayT]:
+        r = np.sqrt(p.x ** 2 + p.y ** 2 + p.z ** 2)
+        theta = np.arccos(np.clip(np.divide(p.z, r, out=np.ones_like(r), where=r > 0), -1.0, 1.0))
+        phi = np.mod(np.arctan2(p.y, p.x) - axes.phi[0], 2 * np.pi) + axes.phi[0]
 
-        xi = np.linspace(np.min(grid.x), np.max(grid.x), self.__dims.x_dim)
-        yi = np.linspace(np.min(grid.y), np.max(grid.y), self.__dims.y_dim)
-        zi = np.linspace(np.min(grid.z), np.max(grid.z), self.__dims.z_dim)
+        ir, wr = cls.__locate(axes.r, r)
+        itheta, wtheta = cls.__locate(axes.theta, theta)
 
-        query_points = np.stack(np.meshgrid(xi, yi, zi, indexing="ij"), axis=-1).reshape(-1, 3)
+        # the azimuthal axis is periodic, so the cell after its last sample wraps around to the first one
+        phi_axis = axes.phi if axes.phi[-1] - axes.phi[0] >= 2 * np.pi - 1e-9 else np.append(axes.phi, axes.phi[0] + 2 * np.pi)
+        iphi, wphi = cls.__locate(phi_axis, phi)
 
-        points = np.column_stack(grid.ravel())
-        tree = cKDTree(points)
+        n_theta, n_phi = axes.theta.size, axes.phi.size
+        idx = np.empty((len(r), 8), dtype=NPIntT)
+        w = np.empty((len(r), 8), dtype=r.dtype)
+        for corner in range(8):
+            dr, dtheta, dphi = corner >> 2 & 1, corner >> 1 & 1, corner & 1
+            idx[:, corner] = ((ir + dr) * n_theta + itheta + dtheta) * n_phi + (iphi + dphi) % n_phi
+            w[:, corner] = (wr if dr else 1 - wr) * (wtheta if dtheta else 1 - wtheta) * (wphi if dphi else 1 - wphi)
 
-        dist, idx = tree.query(query_points, k=8, workers=-1)
+        # voxels outside of the sampled sphere stay empty
+        w[r > axes.r[-1]] = 0.0
+        return idx, w
+    @staticmethod
+    def __kdtree(tree: cKDTree, p: CartPoints) -> Tuple[NPArrayT, NPFArrayT]:
+        dist, idx = tree.query(np.column_stack(p), k=8, workers=-1)
 
         w = 1.0 / (dist + 1e-6)
         w /= w.sum(axis=1, keepdims=True)
+        return idx, w
+    def val(self, t: float = 0.0, masked: bool = False, out: Optional[NPFArrayT] = None, bricks: Optional[NPFArrayT] = None) -> Volume:
+        out = np.empty(self.__dims, dtype=self.__real) if out is None else out.reshape(self.__dims)
+        if self.__idx is None and self.__expand is None:
+            self.__prob_func.val(t, out)
+        elif self.__idx is None:
+            val = self.__scratch('val', (self.__prob_func.size + 1,), self.__real)
+            val[-1] = 0.0
+            self.__prob_func.val(t, val[:-1])
+            np.take(val, self.__expand, out=out.reshape(-1), mode='clip')
+        elif self.__terms is not None:
+            coeffs = self.__prob_func.coeffs(t)
+            if Planner.mapped(self.__terms):
+                for sl in self.__chunks(len(self.__terms) * self.__terms.itemsize):
+                    np.dot(coeffs, self.__terms[:, sl], out=out.reshape(-1)[sl])
+            else:
+                np.dot(coeffs, self.__terms, out=out.reshape(-1))
+        else:
+            val = self.__prob_func.val(t, self.__scratch('val', (self.__prob_func.size,), self.__real))
+            values = self.__scratch('values', self.__dims, self.__real)
+            self.__resample(val.ravel(), values.reshape(-1))
+            # the separable filter passes alternate between the scratch and the frame, as filtering in place copies the input
+            for axis, (src, dst) in enumerate(((values, out), (out, values), (values, out))):
+                gaussian_filter1d(src, sigma=self.__sigma, axis=axis, output=dst)
 
-        self.__idx = idx
-        self.__w = w
-    def val(self, t: float = 0.0) -> Volume:
-        values = np.sum(self.__val_func(t).ravel()[self.__idx] * self.__w, axis=1).reshape(self.__dims)
-        return Volume(gaussian_filter(values, sigma=0.6))
+        if masked:
+            # same cutoff as Volume.masked, applied in place through a mask of the thread
+            mask = self.__scratch('mask', self.__dims, np.dtype(bool))
+            np.putmask(out, np.less_equal(out, np.max(out) * 0.001, out=mask), 0.0)
+        if self.__bricks is not None:
+            bricks = self.__bricks.stats(out, bricks)
+        return Volume(out.view(), bricks=bricks)
 
-__all__ = ['StateSpec', 'State', 'WaveFunction', 'ProbFunction', 'Atom', 'Plotter', 'ScatterFunction', 'VolumeFunction']
\ No newline at end of file
+__all__ = ['StateSpec', 'State', 'WaveFunction', 'ProbFunction', 'SymmetricProbFunction', 'Atom', 'Plotter', 'ScatterFunction', 'VolumeFunction']
\ No newline at end of file
@@ -1,6 +1,6 @@
 # python internals
 from __future__ import annotations
-from typing import TypeAlias, Tuple, NamedTuple, Literal
+from typing import TypeAlias, Tuple, NamedTuple, Literal, Optional
 from dataclasses import dataclass
 import math
 # external packages
@@ -20,14 +20,49 @@ NPCArrayT: TypeAlias = npt.NDArray[NPComplexT]
 NPBArrayT: TypeAlias = npt.NDArray[bool]
 ColormapT: TypeAlias = ColorMap
 ColormapTypeT: TypeAlias = Literal['plasma', 'inferno', 'viridis', 'turbo', 'cividis']
+ProbModeT: TypeAlias = Literal['direct', 'cross', 'basis']
+ResamplerT: TypeAlias = Literal['trilinear', 'kdtree', 'native']
+VolumeBackendT: TypeAlias = Literal['gather', 'operator']
+RadialT: TypeAlias = Literal['uniform', 'probability']
+PrecisionT: TypeAlias = Literal['single', 'double']
+WorkerBackendT: TypeAlias = Literal['thread', 'process']
 
 # type definitions
+class Precision(NamedTuple):
+    real: type; complex: type
+    @classmethod
+    def of(cls, precision: PrecisionT) -> Precision:
+        if precision == 'single':
+            return cls(NPFloatT, NPComplexT)
+        if precision == 'double':
+            return cls(np.float64, np.complex128)
+        raise ValueError(f"Nieznana precyzja obliczeń: '{precision}'")
+
 class SphDims(NamedTuple):
     r_dim: int; angle_dim: int
     def to_cart(self) -> CartDims:
         dim = math.ceil((self.r_dim + 2*self.angle_dim) / 3)
         dim = max(dim, self.r_dim, self.angle_dim)
         return CartDims(dim, dim, dim)
+    def axes(self, rmax: float) -> SphAxes:
+        r = np.linspace(0, rmax, self.r_dim)
+        theta = np.linspace(0, np.pi, self.angle_dim)
+        phi = np.linspace(0, 2 * np.pi, self.angle_dim)
+        return SphAxes(r, theta, phi)
+
+class EqualAreaDims(NamedTuple):
+    r_dim: int; angle_dim: int
+    def to_cart(self) -> CartDims:
+        return SphDims(*self).to_cart()
+    def axes(self, rmax: float) -> SphAxes:
+        # the origin, the poles and the seam, where a uniform grid repeats points, are not sampled; rings uniform in
+        # cos(theta) stand for bands of equal area, so the points cover the sphere evenly, and only as many rings are
+        # kept as give the equator the spacing of a uniform grid of the same angle_dim
+        n_theta = max(1, round(2 * (self.angle_dim - 1) / np.pi))
+        r = np.arange(1, self.r_dim + 1) * (rmax / self.r_dim)
+        theta = np.arccos(1 - (2 * np.arange(n_theta) + 1) / n_theta)
+        phi = np.arange(self.angle_dim) * (2 * np.pi / self.angle_dim)
+        return SphAxes(r, theta, phi)
 
 class CartDims(NamedTuple):
     x_dim: int; y_dim: int; z_dim: int
@@ -45,34 +80,62 @@ class CartPointsGrid(NamedTuple):
     def ravel(self):
         return CartPoints(self.x.ravel(), self.y.ravel(), self.z.ravel())
 
+class SphAxes(NamedTuple):
+    r: NPFArrayT; theta: NPFArrayT; phi: NPFArrayT
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.r.size, self.theta.size, self.phi.size
+    def to_cart(self) -> CartPointsGrid:
+        sin_theta = np.sin(self.theta)[:, np.newaxis]
+        return CartPointsGrid(
+            np.multiply.outer(self.r, sin_theta * np.cos(self.phi)),
+            np.multiply.outer(self.r, sin_theta * np.sin(self.phi)),
+            np.multiply.outer(self.r, np.broadcast_to(np.cos(self.theta)[:, np.newaxis], self.shape[1:]))
+        )
+
 class SphPoints(NamedTuple): r: NPFArrayT; theta: NPFArrayT; phi: NPFArrayT
 class CartPoints(NamedTuple): x: NPFArrayT; y: NPFArrayT; z: NPFArrayT
 
 @dataclass(frozen=True, slots=True)
 class Scatter:
-    points: Tuple[np.ndarray, np.ndarray, np.ndarray]
+    pos: NPFArrayT
     val: np.ndarray
+    color: Optional[np.ndarray] = None
     def __post_init__(self):
-        for p in self.points:
-            p.setflags(write=False)
+        self.pos.setflags(write=False)
         self.val.setflags(write=False)
+        if self.color is not None:
+            self.color.setflags(write=False)
     def copy(self) -> Scatter:
-        return Scatter(points=tuple(np.copy(p) for p in self.points), val=np.copy(self.val))
+        # positions are read-only and may be shared by every frame of a fixed point set
+        return Scatter(pos=self.pos, val=np.copy(self.val), color=None if self.color is None else np.copy(self.color))
     def masked(self, factor: float = 0.001) -> Scatter:
         cutoff = np.max(self.val) * factor
         mask = self.val > cutoff
-        return Scatter(CartPoints(*(arr[mask] for arr in self.points)), self.val[mask])
+        return Scatter(self.pos[mask], self.val[mask], None if self.color is None else self.color[mask])
 
 @dataclass(frozen=True, slots=True)
 class Volume:
     val: np.ndarray
+    color: Optional[np.ndarray] = None
+    bricks: Optional[np.ndarray] = None
+    # the density encoded colors are relative to, as a single element so it travels in slab slots like the other fields
+    vmax: Optional[np.ndarray] = None
     def __post_init__(self):
         self.val.setflags(write=False)
+        if self.color is not None:
+            self.color.setflags(write=False)
+        if self.bricks is not None:
+            self.bricks.setflags(write=False)
+        if self.vmax is not None:
+            self.vmax.setflags(write=False)
     def copy(self) -> Volume:
-        return Volume(np.copy(self.val))
+        return Volume(np.copy(self.val), None if self.color is None else np.copy(self.color),
+                      None if self.bricks is None else np.copy(self.bricks), None if self.vmax is None else np.copy(self.vmax))
     def masked(self, factor: float = 0.001) -> Volume:
+        # colors and brick statistics of the frame no longer match the masked values
         cutoff = np.max(self.val) * factor
         return Volume(np.where(self.val > cutoff, self.val, 0.0))
 
 __all__ = ['NPFloatT', 'NPIntT', 'NPUintT', 'NPComplexT', 'NPArrayT', 'NPFArrayT', 'NPUArrayT', 'NPCArrayT', 'NPBArrayT', 'ColormapT',
-           'ColormapTypeT', 'SphDims', 'CartDims', 'SphPointsGrid', 'CartPointsGrid', 'SphPoints', 'CartPoints', 'Scatter', 'Volume']
\ No newline at end of file
+           'ColormapTypeT', 'ProbModeT', 'ResamplerT', 'VolumeBackendT', 'RadialT', 'PrecisionT', 'WorkerBackendT', 'Precision', 'SphDims', 'EqualAreaDims', 'CartDims', 'SphPointsGrid', 'CartPointsGrid', 'SphAxes', 'SphPoints', 'CartPoints', 'Scatter', 'Volume']
\ No newline at end of file
@@ -0,0 +1,86 @@
+# python internals
+from __future__ import annotations
+from typing import Iterator, Optional, Tuple, Union, Literal, NamedTuple
+import tempfile
+import weakref
+import math
+import os
+# internal packages
+from .ntypes import *
+# external packages
+import numpy as np
+
+class MemoryPlan(NamedTuple):
+    points: int; grid: int; precomputed: int; frame: int
+    @property
+    def total(self) -> int:
+        return self.grid + self.precomputed + self.frame
+
+class Planner:
+    def __init__(self, budget: Optional[int] = None, path: Optional[str] = None, chunk: int = 1 << 16) -> None:
+        if budget is not None and budget <= 0:
+            raise ValueError("Budżet pamięci musi być większy od 0")
+        if chunk <= 0:
+            raise ValueError("Rozmiar bloku musi być większy od 0")
+
+        self.__budget = budget
+        self.__path = path
+        self.__chunk = chunk
+    @property
+    def budget(self) -> Optional[int]:
+        return self.__budget
+    @staticmethod
+    def estimate(dims: Union[SphDims, EqualAreaDims, CartDims], states: int, mode: ProbModeT, output: Literal['scatter', 'volume'] = 'scatter',
+                 precision: PrecisionT = 'single') -> MemoryPlan:
+        float_size, complex_size = (np.dtype(dtype).itemsize for dtype in Precision.of(precision))
+        # spherical dims name a single angular size for both angles, the grid has as many points as its axes span
+        points = math.prod(dims) if type(dims) is CartDims else math.prod(dims.axes(1.0).shape)
+        # positions of the scatter points, or coordinates and gather indices of natively evaluated voxels
+        grid = 3 * float_size * points
+        if output == 'volume':
+            grid += 3 * np.dtype(NPIntT).itemsize * points
+
+        if mode == 'cross':
+            precomputed = (1 + states * (states - 1)) * float_size * points
+        elif mode == 'basis':
+            precomputed = states * complex_size * points
+        else:
+            precomputed = 0
+
+        frame = float_size * points
+        return MemoryPlan(points, grid, precomputed, frame)
+    def fits(self, plan: MemoryPlan) -> bool:
+        return self.__budget is None or plan.total <= self.__budget
+    def chunks(self, total: int, row_bytes: int, unit: int = 1) -> Iterator[slice]:
+        rows = self.__chunk
+        if self.__budget is not None:
+            # temporaries of a single block take a small fraction of the budget
+            rows = min(rows, max(1, self.__budget // (16 * max(row_bytes, 1))))
+        rows = max(unit, rows // unit * unit)
+        for start in range(0, total, rows):
+            yield slice(start, min(start + rows, total))
+    def allocate(self, shape: Tuple[int, ...], dtype: np.dtype) -> NPArrayT:
+        nbytes = math.prod(shape) * np.dtype(dtype).itemsize
+        if self.__budget is None or nbytes <= self.__budget // 4:
+            return np.empty(shape, dtype=dtype)
+
+        # arrays that do not fit next to the rest of the data are backed by a temporary file
+        fd, file = tempfile.mkstemp(suffix='.dat', dir=self.__path)
+        os.close(fd)
+        arr = np.memmap(file, dtype=dtype, mode='w+', shape=shape)
+        weakref.finalize(arr, self.__remove, file)
+        return arr
+    @staticmethod
+    def mapped(arr: NPArrayT) -> bool:
+        while arr is not None:
+            if isinstance(arr, np.memmap):
+                return True
+            arr = arr.base if isinstance(arr.base, np.ndarray) else None
+        return False
+    @staticmethod
+    def __remove(file: str) -> None:
+        try:
+            os.remove(file)
+        except OSError: pass
+
+__all__ = ['MemoryPlan', 'Planner']
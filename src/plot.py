@@ -1,17 +1,20 @@
 # python internals
 from __future__ import annotations
-from typing import Tuple, Callable, Union, Optional
+from typing import Tuple, Callable, Union, Optional, Any
 from dataclasses import dataclass
 # internal packages
 from .ntypes import *
 from .scheduler import Scheduler
-from .worker import Worker
+from .worker import Worker, ProcessWorker
+from .buffer import SlabBuffer
+from .shared import SharedPool
+from .color import ColorScale, Colorizer, DensityEncoder, FrameRenderer
+from .items import ScatterItem, VolumeItem
 from .view import WindowView, Hud, ColorBar
 # external packages
 from PyQt6.QtGui import QColor, QPalette
 import numpy as np
 import pyqtgraph as pg
-import pyqtgraph.opengl as gl
 
 @dataclass
 class WindowSpec:
@@ -23,10 +26,14 @@ class WindowSpec:
     cmap_name: ColormapTypeT = 'plasma'
 
 class Window:
-    def __init__(self, spec: WindowSpec) -> None:
+    def __init__(self, spec: WindowSpec, colorizer: Callable[[ColormapT, ColorScale], Union[Colorizer, DensityEncoder]]) -> None:
+        # the colorizer is made anew against the current scale, which is moved to shared memory for process workers
+        self.__colorizer = colorizer
         self.__scheduler: Optional[Scheduler] = None
-        self.__worker: Optional[Worker] = None
-        self.__scale: float = 0
+        self.__worker: Optional[Union[Worker, ProcessWorker]] = None
+        self._scale = ColorScale()
+        self.__shown: float = 0.0
+        self.__template: Optional[Union[Scatter, Volume]] = None
 
         self._view = WindowView()
         self._view.setWindowTitle(spec.title)
@@ -58,22 +65,31 @@ class Window:
             self._view.colorbar.show()
 
     def _normalize(self, val: NPFArrayT) -> NPFArrayT:
-        v_log = np.log1p(np.maximum(val, 0.0))
-        return v_log / np.log1p(self.__scale)
-    def draw(self, val: Union[Scatter, Volume]) -> None:
-        vmax = np.max(val.val)
-        self.__scale = vmax
+        return self._scale.normalize(val)
+    def __colored(self, val: Union[Scatter, Volume]) -> Union[Scatter, Volume]:
+        return val if val.color is not None else self.__colorizer(self._cmap, self._scale).frame(val)
+    def draw(self, val: Union[Scatter, Volume]) -> Union[Scatter, Volume]:
+        vmax = float(np.max(val.val))
+        self._scale.reset(vmax)
+        self.__shown = vmax
+        self.__template = self.__colored(val)
         if self._view.colorbar is not None:
             self._view.colorbar.set_scale(vmax)
             self._view.colorbar.set_val(val.val)
-    def update(self, val: Union[Scatter, Volume]) -> None:
-        if self._view.colorbar is not None:
-            vmax = np.max(val.val)
-            if self.__scale < vmax:
-                self.__scale = vmax
-                self._view.colorbar.set_scale(self.__scale)
-                self._view.colorbar.set_val(val.val)
-    def auto_update(self, function: Callable[[int], Union[Scatter, Volume]], fps: int) -> Scheduler:
+        return self.__template
+    def update(self, val: Union[Scatter, Volume]) -> Union[Scatter, Volume]:
+        # frames arrive colored by the workers, which also grow the shared scale
+        val = self.__colored(val)
+        if self._view.colorbar is not None and self._scale.value > self.__shown:
+            self.__shown = self._scale.value
+            self._view.colorbar.set_scale(self.__shown)
+            self._view.colorbar.set_val(val.val)
+        return val
+    def auto_update(self, function: Callable[..., Union[Scatter, Volume]], fps: int, workers: int = 1,
+                    backend: WorkerBackendT = 'thread', arg: Optional[Callable[[int], Any]] = None, budget: Optional[int] = None) -> Scheduler:
+        if self.__template is None:
+            raise RuntimeError("Wykres nie został narysowany")
+
         if self.__scheduler is not None:
             self.__scheduler.abort()
             self.__scheduler.deleteLater()
@@ -84,10 +100,42 @@ class Window:
             self.__worker.deleteLater()
             self.__worker = None
 
-        self.__scheduler = Scheduler(func=self.update, max_fps=fps, parent=self._view)
-        self.__worker = Worker(func=function, buffer=self.__scheduler.buffer, parent=self._view)
+        # frames, their colors, brick statistics and encoding ranges are written in place into slabs shaped after the drawn frame,
+        # with one spare slot per worker and one for drawing
+        capacity = Scheduler.capacity(fps)
+        fields = tuple(field for field in ('val', 'color', 'bricks', 'vmax') if getattr(self.__template, field, None) is not None)
+        if budget is not None:
+            # the slab counts against the memory budget; slots it has no room for are taken evenly from the queue and the workers,
+            # down to a frame being computed, one queued and one drawn
+            slots = max(3, budget // sum(getattr(self.__template, field).nbytes for field in fields))
+            if capacity + workers + 1 > slots:
+                capacity = min(capacity, max(1, (slots - 1) // 2))
+                workers = min(workers, slots - 1 - capacity)
+        if backend == 'process':
+            pool = SharedPool()
+            allocate = lambda shape, dtype: pool.array(shape, dtype)[1]
+            self._scale = ColorScale(self._scale.value, allocate=allocate)
+            buffer = SlabBuffer(capacity, self.__template, workers + 1, fields, allocate=allocate)
+            renderer = FrameRenderer(function, self.__colorizer(self._cmap, self._scale))
+            self.__scheduler = Scheduler(func=self.update, max_fps=fps, buffer=buffer, parent=self._view)
+            self.__worker = ProcessWorker(func=renderer, buffer=buffer, pool=pool, processes=workers, arg=arg,
+                                          clock=self.__scheduler.due, parent=self._view)
+        elif backend == 'thread':
+            buffer = SlabBuffer(capacity, self.__template, workers + 1, fields)
+            renderer = FrameRenderer(function, self.__colorizer(self._cmap, self._scale))
+            func = renderer if arg is None else lambda i, **out: renderer(arg(i), **out)
+            self.__scheduler = Scheduler(func=self.update, max_fps=fps, buffer=buffer, parent=self._view)
+            self.__worker = Worker(func=func, buffer=buffer, threads=workers, clock=self.__scheduler.due, parent=self._view)
+        else:
+            raise ValueError(f"Nieznany tryb obliczeń klatek: '{backend}'")
 
         return self.__scheduler
+    @property
+    def compute(self) -> float:
+        # time the workers take per frame, with the frames shared out between them
+        if self.__worker is None: return 0.0
+        workers = self.__worker.threads if isinstance(self.__worker, Worker) else self.__worker.processes
+        return self.__worker.latency / workers
     def show(self) -> None:
         self._view.showMaximized()
     def set_hud(self, text: str) -> None:
@@ -135,29 +183,33 @@ class Window:
             self.__worker = None
 
 class ScatterWindow(Window):
-    def __init__(self, spec: WindowSpec = WindowSpec()) -> None:
-        super().__init__(spec)
-        self.__scatter: Optional[gl.GLScatterPlotItem] = None
-    def __color(self, sc: Scatter) -> NPFArrayT:
-        rgba = self._cmap.map(self._normalize(sc.val) ** 0.4, mode='float')
-        rgba[:, 3] = 1.0
-        return np.ascontiguousarray(rgba)
+    def __init__(self, spec: WindowSpec = WindowSpec(), size: float = 2.0, blending: str = 'translucent') -> None:
+        super().__init__(spec, lambda cmap, scale: Colorizer(cmap, scale, dtype=NPUintT, cutoff=0.001))
+        self.__scatter: Optional[ScatterItem] = None
+        self.__pos: Optional[NPFArrayT] = None
+        self.__size = size
+        self.__blending = blending
     @property
     def type(self): return "scatter"
     def draw(self, sc: Scatter) -> None:
-        super().draw(sc)
+        sc = super().draw(sc)
         if self.__scatter is None:
-            self.__scatter = gl.GLScatterPlotItem(pos=np.column_stack(sc.points), color=self.__color(sc), size=2)
-            self.__scatter.setGLOptions('translucent')
+            self.__scatter = ScatterItem(pos=sc.pos, color=sc.color, size=self.__size, blending=self.__blending)
             self._view.plot.addItem(self.__scatter)
         else:
-            self.__scatter.setData(pos=np.column_stack(sc.points), color=self.__color(sc), size=2)
+            self.__scatter.set_positions(sc.pos)
+            self.__scatter.set_colors(sc.color)
+        self.__pos = sc.pos
     def update(self, sc: Scatter) -> None:
         if self.__scatter is None:
             raise RuntimeError("Wykres punktowy nie został narysowany")
 
-        super().update(sc)
-        self.__scatter.setData(pos=np.column_stack(sc.points), color=self.__color(sc))
+        # positions stay in their buffer on the GPU for as long as the frames share them, only colors are streamed
+        sc = super().update(sc)
+        if sc.pos is not self.__pos:
+            self.__scatter.set_positions(sc.pos)
+            self.__pos = sc.pos
+        self.__scatter.set_colors(sc.color)
     def center(self) -> None:
         if self.__scatter is None: return
 
@@ -166,36 +218,40 @@ class ScatterWindow(Window):
 
 class VolumeWindow(Window):
     def __init__(self, spec: WindowSpec = WindowSpec()) -> None:
-        super().__init__(spec)
-        self.__volume: Optional[gl.GLVolumeItem] = None
-    def __color(self, vl: Volume) -> NPUArrayT:
-        v_norm = self._normalize(vl.val)
-
-        rgba = self._cmap.map(v_norm ** 0.4, mode='float').reshape((*v_norm.shape, 4))
-        rgba[..., 3] = v_norm ** 0.5
-        return np.ascontiguousarray((rgba * 255).astype(NPUintT))
+        super().__init__(spec, lambda cmap, scale: DensityEncoder(scale))
+        self.__volume: Optional[VolumeItem] = None
+        self.__extent: Optional[NPFArrayT] = None
     @property
     def type(self): return "volume"
     def draw(self, vl: Volume) -> None:
-        super().draw(vl)
+        vl = super().draw(vl)
         if self.__volume is None:
-            self.__volume = gl.GLVolumeItem(data=self.__color(vl), smooth=True, sliceDensity=1)
+            self.__volume = VolumeItem(vl.color, self._cmap, self._scale.value, smooth=True, sliceDensity=1)
             self._view.plot.addItem(self.__volume)
-        else:
-            self.__volume.setData(data=self.__color(vl), smooth=True, sliceDensity=1)
+        self.__volume.set_scale(self._scale.value)
+        self.__volume.setData(vl.color, vmax=float(vl.vmax[0]), bricks=vl.bricks)
 
         self.center()
     def update(self, vl: Volume) -> None:
         if self.__volume is None:
             raise RuntimeError("Wykres chmurowy nie został narysowany")
 
-        super().update(vl)
-        self.__volume.setData(self.__color(vl))
+        # frames carry densities relative to the scale they were encoded against, the current scale only changes a uniform of the shader
+        vl = super().update(vl)
+        self.__volume.set_scale(self._scale.value)
+        self.__volume.setData(vl.color, vmax=float(vl.vmax[0]), bricks=vl.bricks)
     def center(self) -> None:
         if self.__volume is None: return
 
+        # volumes drawn at another resolution are scaled to the extent of the first one
         shape = np.array(self.__volume.data.shape, dtype=NPFloatT)
-        center_offset = shape / 2
-        self.__volume.translate(-center_offset[0], -center_offset[1], -center_offset[2])
+        if self.__extent is None:
+            self.__extent = shape
+        factor = self.__extent / shape
+        center_offset = self.__extent / 2
+        transform = pg.Transform3D()
+        transform.translate(-center_offset[0], -center_offset[1], -center_offset[2])
+        transform.scale(factor[0], factor[1], factor[2])
+        self.__volume.setTransform(transform)
 
 __all__ = ['WindowSpec', 'ScatterWindow', 'VolumeWindow']
\ No newline at end of file
@@ -0,0 +1,131 @@
+# python internals
+from __future__ import annotations
+from typing import Any, Callable, Dict, Optional
+import time
+# external packages
+from PyQt6.QtCore import Qt, QObject, QThreadPool, pyqtSignal, pyqtSlot
+
+class QualityController(QObject):
+    levelChangeOccurred = pyqtSignal(int)
+    def __init__(self, fps: int, levels: int, ratio: float = 0.5, interval: float = 1.0, patience: int = 3,
+                 margin: float = 0.8, parent: Optional[QObject] = None) -> None:
+        if fps <= 0: raise ValueError("Wartość FPS musi być większa od 0")
+        if levels <= 0: raise ValueError("Liczba poziomów jakości musi być większa od 0")
+        if not 0.0 < ratio < 1.0: raise ValueError("Koszt poziomu jakości musi być ułamkiem kosztu poziomu wyższego")
+
+        super().__init__(parent)
+
+        # level 0 is the full quality, every next one costs the given ratio of the one before it
+        self.__fps = fps
+        self.__levels = levels
+        self.__ratio = ratio
+        self.__interval = interval
+        self.__patience = patience
+        self.__margin = margin
+        self.__level: int = 0
+        self.__load: float = 0.0
+        self.__calm: int = 0
+        self.__since: float = time.monotonic()
+        self.__raised: float = float("-inf")
+    @property
+    def level(self) -> int:
+        return self.__level
+    @property
+    def levels(self) -> int:
+        return self.__levels
+    @property
+    def load(self) -> float:
+        return self.__load
+    def observe(self, compute: float, present: float) -> None:
+        # compute is the time the workers spend per frame, present the time the view takes to show one
+        now = time.monotonic()
+        if compute <= 0.0:
+            # nothing measured yet on this level, its first interval starts with the first measurement
+            self.__since = now
+            return
+        if now - self.__since < self.__interval: return
+        self.__since = now
+
+        # fraction of the frame period taken by the slower of the two stages
+        self.__load = max(compute, present) * self.__fps
+        if self.__load > 1.0 and self.__level < self.__levels - 1:
+            # a level that could not be held right after raising the quality to it is tried back less eagerly
+            if now - self.__raised < 2 * self.__interval:
+                self.__patience *= 2
+            self.__set(self.__level + 1)
+        elif self.__load < self.__ratio * self.__margin and self.__level > 0:
+            # the level above would still leave some headroom, after a few such intervals in a row
+            self.__calm += 1
+            if self.__calm >= self.__patience:
+                self.__raised = now
+                self.__set(self.__level - 1)
+        else:
+            self.__calm = 0
+    def __set(self, level: int) -> None:
+        self.__level = level
+        self.__calm = 0
+        self.__since = time.monotonic()
+        self.levelChangeOccurred.emit(level)
+
+class LevelBuilder(QObject):
+    levelReadyOccurred = pyqtSignal(int)
+    errorOccurred = pyqtSignal(Exception)
+    __builtOccurred = pyqtSignal(int, object)
+    __failedOccurred = pyqtSignal(Exception)
+    def __init__(self, build: Callable[[int], Any], levels: int, parent: Optional[QObject] = None) -> None:
+        if levels <= 0: raise ValueError("Liczba poziomów jakości musi być większa od 0")
+
+        super().__init__(parent)
+
+        self.__build = build
+        self.__levels = levels
+        self.__built: Dict[int, Any] = {}
+        self.__aborted: bool = False
+        # levels are built one after another on a single thread of their own, so the frame workers keep the other cores
+        self.__pool = QThreadPool(self)
+        self.__pool.setMaxThreadCount(1)
+        # results are handed over to the thread the builder lives in
+        self.__builtOccurred.connect(self.__on_built, Qt.ConnectionType.QueuedConnection)
+        self.__failedOccurred.connect(self.__on_failed, Qt.ConnectionType.QueuedConnection)
+    def __getitem__(self, level: int) -> Any:
+        return self.__built[level]
+    @property
+    def levels(self) -> int:
+        return self.__levels
+    @property
+    def ready(self) -> int:
+        # levels are built finest first, so the ready ones are always the first few
+        return len(self.__built)
+    def build(self, level: int) -> Any:
+        # built right away on the calling thread, for the level that has to be shown first
+        if level not in self.__built:
+            self.__built[level] = self.__build(level)
+        return self.__built[level]
+    def start(self) -> None:
+        if self.__aborted or self.ready >= self.__levels: return
+        level = self.ready
+        self.__pool.start(lambda: self.__run(level))
+    def __run(self, level: int) -> None:
+        try:
+            value = self.__build(level)
+        except Exception as e:
+            self.__failedOccurred.emit(e)
+            return
+        self.__builtOccurred.emit(level, value)
+    @pyqtSlot(int, object)
+    def __on_built(self, level: int, value: Any) -> None:
+        if self.__aborted: return
+
+        self.__built[level] = value
+        self.levelReadyOccurred.emit(level)
+        self.start()
+    @pyqtSlot(Exception)
+    def __on_failed(self, error: Exception) -> None:
+        if not self.__aborted:
+            self.errorOccurred.emit(error)
+    def abort(self) -> None:
+        # a level being built is finished in the background, but nothing is built after it and its result is dropped
+        self.__aborted = True
+        self.__pool.clear()
+
+__all__ = ['QualityController', 'LevelBuilder']
@@ -1,54 +1,101 @@
 # python internals
 from __future__ import annotations
-from typing import Callable, Optional, Generic, TypeVar
+from typing import Callable, Optional, Generic, TypeVar, Union, Deque
+from collections import deque
+import math
 import time
 # internal packages
-from .buffer import Buffer
+from .buffer import Buffer, SlabBuffer
 # external packages
 from PyQt6.QtCore import Qt, QObject, QTimer, pyqtSignal
 
 T = TypeVar("T")
 class Scheduler(QObject, Generic[T]):
     stepOccurred = pyqtSignal(int)
-    def __init__(self, func: Callable[[T], None], max_fps: int, parent: Optional[QObject] = None) -> None:
+    def __init__(self, func: Callable[[T], None], max_fps: int, buffer: Optional[Union[Buffer[T], SlabBuffer[T]]] = None,
+                 parent: Optional[QObject] = None) -> None:
         if max_fps <= 0: raise ValueError("Wartość FPS musi być większa od 0")
 
         super().__init__(parent)
 
         self.__func: Optional[Callable[[T], None]] = func
-        self.__buffer: Buffer[T] = Buffer(int(0.9 * max_fps))
+        self.__buffer: Union[Buffer[T], SlabBuffer[T]] = buffer if buffer is not None else Buffer(Scheduler.capacity(max_fps))
         self.__blocked_until: float = 0.0
 
+        # frame i is due i frame periods after the start, so animation time follows the wall clock
         self.__iter: int = 0
         self.__dt: float = 1.0 / max_fps
-        self.__last_step: float = 0.0
-        self.__fps: float = 0.0
+        self.__start: float = time.monotonic()
+        self.__due: int = -1
+        self.__missed: int = 0
+        self.__jitter: float = 0.0
+        self.__present: float = 0.0
+        self.__window: int = max_fps
+        self.__shown: Deque[float] = deque(maxlen=max_fps + 1)
 
+        # a single-shot timer sleeps until the next deadline instead of polling the clock
         self.__timer = QTimer(self)
         self.__timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.__timer.setSingleShot(True)
         self.__timer.timeout.connect(self.step)
         self.__timer.start(0)
+    def due(self, t: Optional[float] = None) -> int:
+        # index of the first frame whose deadline is not over at the given time
+        t = time.monotonic() if t is None else t
+        return max(0, math.ceil((t - self.__start) / self.__dt))
     def step(self) -> None:
         if self.__func is None: return
 
-        curr_step = time.monotonic()
-        if curr_step < self.__blocked_until or curr_step - self.__last_step < self.__dt: return
+        now = time.monotonic()
+        due = int((now - self.__start) / self.__dt)
+        self.__timer.start(max(0, math.ceil((self.__start + (due + 1) * self.__dt - now) * 1000)))
+        # a timer firing early wakes up within the period it has already served
+        if due <= self.__due: return
 
-        value = self.__buffer.pop()
-        if value is None: return
+        # deadlines the timer woke up too late for passed without any frame
+        self.__missed += due - self.__due - 1
+        self.__due = due
 
-        self.__fps = 1/(curr_step - self.__last_step) if self.__last_step > 0 else 0
-        self.__last_step = curr_step
+        # how late the timer woke up after the deadline, smoothed over about a second
+        self.__jitter += (now - (self.__start + due * self.__dt) - self.__jitter) / self.__window
+
+        if now < self.__blocked_until: return
+
+        value = self.__buffer.pop(due)
+        if value is None:
+            self.__missed += 1
+            return
+
+        self.__shown.append(now)
         self.__func(value)
+        self.__present += (time.monotonic() - now - self.__present) / self.__window
 
         self.__iter+= 1
         self.stepOccurred.emit(self.__iter)
+    @staticmethod
+    def capacity(max_fps: int) -> int:
+        return max(1, int(0.9 * max_fps))
     @property
-    def buffer(self) -> Buffer[T]:
+    def buffer(self) -> Union[Buffer[T], SlabBuffer[T]]:
         return self.__buffer
     @property
     def fps(self) -> float:
-        return self.__fps
+        # frames actually shown over the last second or so
+        if len(self.__shown) < 2: return 0.0
+        return (len(self.__shown) - 1) / (self.__shown[-1] - self.__shown[0])
+    @property
+    def jitter(self) -> float:
+        return self.__jitter
+    @property
+    def present(self) -> float:
+        # time it takes to hand a frame over to the view, smoothed like the jitter
+        return self.__present
+    @property
+    def dropped(self) -> int:
+        return self.__buffer.dropped
+    @property
+    def missed(self) -> int:
+        return self.__missed
     def block(self, t: Optional[float] = None) -> None:
         unblock_time = float("inf") if t is None else time.monotonic() + t
         if unblock_time > self.__blocked_until:
@@ -59,4 +106,4 @@ class Scheduler(QObject, Generic[T]):
         self.__func = None
         self.__timer.stop()
 
-__all__ = ['Scheduler']
\ No newline at end of file
+__all__ = ['Scheduler']
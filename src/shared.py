@@ -0,0 +1,90 @@
+# python internals
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from multiprocessing.shared_memory import SharedMemory
+import weakref
+import pickle
+import io
+# internal packages
+from .ntypes import NPArrayT
+# external packages
+import numpy as np
+
+# segments attached by this process, kept open for as long as the process uses them
+_attached: Dict[str, Tuple[SharedMemory, NPArrayT]] = {}
+# frame function of a worker process and the slabs of the frame buffer it writes into
+_func: Optional[Callable[..., Any]] = None
+_slab: Dict[str, NPArrayT] = {}
+
+def attach(name: str, shape: Tuple[int, ...], dtype: str) -> NPArrayT:
+    if name not in _attached:
+        shm = SharedMemory(name=name)
+        _attached[name] = (shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+    return _attached[name][1]
+
+def init_worker(data: bytes, slab: Dict[str, Tuple[str, Tuple[int, ...], str]]) -> None:
+    global _func, _slab
+    _func = pickle.loads(data)
+    _slab = {field: attach(*spec) for field, spec in slab.items()}
+
+def run_worker(arg: Any, slot: int) -> None:
+    out = {field: slab[slot] for field, slab in _slab.items()}
+    result = _func(arg, **out)
+    for field, view in out.items():
+        value = getattr(result, field)
+        if not np.shares_memory(value, view):
+            np.copyto(view, np.reshape(value, view.shape))
+
+class SharedPool:
+    def __init__(self, threshold: int = 1 << 12) -> None:
+        self.__threshold = threshold
+        self.__segments: List[SharedMemory] = []
+        self.__shared: List[NPArrayT] = []
+        self.__arrays: Dict[str, NPArrayT] = {}
+        self.__names: Dict[int, str] = {}
+    def array(self, shape: Tuple[int, ...], dtype: np.dtype) -> Tuple[str, NPArrayT]:
+        shm = SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        # numpy does not pin the mapping, so it is unmapped only once the array and all its views are gone
+        weakref.finalize(arr, shm.close)
+        self.__segments.append(shm)
+        self.__shared.append(arr)
+        self.__arrays[shm.name] = arr
+        self.__names[id(arr)] = shm.name
+        return shm.name, arr
+    def name(self, arr: NPArrayT) -> Optional[str]:
+        name = self.__names.get(id(arr))
+        return name if name is not None and self.__arrays[name] is arr else None
+    def __share(self, arr: NPArrayT) -> Any:
+        # arrays allocated in shared memory always travel by name, other large ones are copied there once
+        name = self.name(arr)
+        if name is None and (arr.dtype.hasobject or arr.nbytes < self.__threshold):
+            return NotImplemented
+        if name is None:
+            name, shared = self.array(arr.shape, arr.dtype)
+            shared[...] = arr
+            # the original array maps to its segment, so sharing it again reuses the copy
+            self.__arrays[name] = arr
+            self.__names[id(arr)] = name
+        return attach, (name, arr.shape, arr.dtype.str)
+    def dumps(self, obj: Any) -> bytes:
+        share = self.__share
+
+        class Pickler(pickle.Pickler):
+            def reducer_override(self, value: Any) -> Any:
+                return share(value) if isinstance(value, np.ndarray) else NotImplemented
+
+        f = io.BytesIO()
+        Pickler(f, pickle.HIGHEST_PROTOCOL).dump(obj)
+        return f.getvalue()
+    def close(self) -> None:
+        for shm in self.__segments:
+            try:
+                shm.unlink()
+            except FileNotFoundError: pass
+        self.__segments.clear()
+        self.__shared.clear()
+        self.__arrays.clear()
+        self.__names.clear()
+
+__all__ = ['attach', 'init_worker', 'run_worker', 'SharedPool']
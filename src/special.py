@@ -0,0 +1,76 @@
+# python internals
+from __future__ import annotations
+from typing import Sequence, Tuple
+import math
+# internal packages
+from .ntypes import NPArrayT
+# external packages
+import numpy as np
+from scipy.special import gammaln, xlogy
+
+# recurrences are carried out on mantissas, which are brought back by this factor whenever they grow past it
+_RESCALE = 1e150
+
+def _states(*args: Sequence[int]) -> Tuple[NPArrayT, ...]:
+    return tuple(np.asarray(arg, dtype=np.float64).reshape(-1, 1) for arg in args)
+
+def _laguerre(k: NPArrayT, alpha: NPArrayT, x: NPArrayT, power: NPArrayT) -> NPArrayT:
+    # x^power e^{-x/2} sqrt(k! / (k + alpha)!) L_k^alpha(x), with the prefactor kept as a logarithm and folded in at the end,
+    # so neither the factorials nor the polynomial itself ever overflow
+    shape = np.broadcast_shapes(k.shape, x.shape)
+    # rows are ordered by degree, so the ones still recurring are always a leading block and the others keep their result
+    order = np.argsort(-k, axis=0, kind='stable').ravel()
+    k, alpha = k[order], alpha[order]
+    x = np.broadcast_to(x, shape)[order]
+    log = xlogy(power[order], x) - x / 2 - gammaln(alpha + 1) / 2
+    prev, cur = np.zeros(shape), np.ones(shape)
+    for j in range(int(k.max(initial=0))):
+        c = int(np.count_nonzero(k > j))
+        a, xc = alpha[:c], x[:c]
+        # L_{j+1} = ((2j + 1 + alpha - x) L_j - (j + alpha) L_{j-1}) / (j + 1), for the normalized polynomials
+        prev[:c], cur[:c] = cur[:c], ((2 * j + 1 + a - xc) * cur[:c] - np.sqrt(j * (j + a)) * prev[:c]) / np.sqrt((j + 1) * (j + 1 + a))
+        big = np.abs(cur[:c]) > _RESCALE
+        if np.any(big):
+            cur[:c][big] /= _RESCALE
+            prev[:c][big] /= _RESCALE
+            log[:c] += big * math.log(_RESCALE)
+
+    out = np.empty(shape)
+    with np.errstate(divide='ignore'):
+        out[order] = np.sign(cur) * np.exp(np.log(np.abs(cur)) + log)
+    return out
+
+def radial(n: Sequence[int], l: Sequence[int], r: NPArrayT, scale: float = 1.0) -> NPArrayT:
+    # normalized radial functions of hydrogen: one row for every (n, l) pair
+    n, l = _states(n, l)
+    rho = 2 * np.asarray(r, dtype=np.float64) / (n * scale)
+    return np.sqrt((2 / (n * scale)) ** 3 / (2 * n)) * _laguerre(n - l - 1, 2 * l + 1, rho, l)
+
+def legendre(l: Sequence[int], m: Sequence[int], theta: NPArrayT) -> NPArrayT:
+    # fully normalized associated Legendre functions of cos(theta) for 0 <= m <= l, without the Condon-Shortley phase, so
+    # that they times e^{im phi} are the spherical harmonics: one row for every (l, m) pair
+    l, m = _states(l, m)
+    theta = np.asarray(theta, dtype=np.float64)
+    x, s = np.cos(theta), np.abs(np.sin(theta))
+
+    # rows are ordered by the number of steps up from the order, as the rows of the Laguerre functions by degree
+    order = np.argsort(m - l, axis=0, kind='stable').ravel()
+    l, m = l[order], m[order]
+
+    # P_m^m = sqrt((2m + 1) / 4pi * (2m)! / (2^m m!)^2) sin^m(theta), from logarithms as the factorials overflow early
+    log = (np.log((2 * m + 1) / (4 * np.pi)) + gammaln(2 * m + 1) - 2 * m * math.log(2) - 2 * gammaln(m + 1)) / 2
+    prev, cur = np.zeros((len(m), len(x))), np.exp(log + xlogy(m, s))
+    for j in range(1, int((l - m).max(initial=0)) + 1):
+        c = int(np.count_nonzero(l - m >= j))
+        # stepping the degree up at a fixed order keeps every function within sqrt(2l + 1) of unity
+        mc = m[:c]
+        d = mc + j
+        a = np.sqrt((4 * d ** 2 - 1) / (d ** 2 - mc ** 2))
+        b = np.sqrt(((d - 1) ** 2 - mc ** 2) / (4 * (d - 1) ** 2 - 1))
+        prev[:c], cur[:c] = cur[:c], a * (x * cur[:c] - b * prev[:c])
+
+    out = np.empty_like(cur)
+    out[order] = cur
+    return out
+
+__all__ = ['radial', 'legendre']
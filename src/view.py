@@ -86,7 +86,7 @@ class ColorBar(QWidget):
             self.__labels_layout.setRowStretch(r, 1)
 
         for i, v in enumerate(values):
-            lbl = QLabel(f"{v:.3f}", self)
+            lbl = QLabel(f"{v:.3g}", self)
             lbl.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
             lbl.setPalette(self.palette())
 
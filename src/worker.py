@@ -1,92 +1,264 @@
 # python internals
 from __future__ import annotations
-from typing import Callable, Optional, Any
+from typing import Callable, Optional, Any, Deque, Dict, Tuple
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import functools
+import time
 # internal packages
-from .buffer import Buffer
+from .buffer import SlabBuffer
+from .shared import SharedPool, init_worker, run_worker
 from .ntypes import NPArrayT
 # external packages
-from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+import numpy as np
 
-class WorkerThread(QObject):
-    resultReadyOccurred = pyqtSignal(object)
-    errorOccurred = pyqtSignal(Exception)
-    def __init__(self, func: Callable[[int], Any], parent: Optional[QObject] = None) -> None:
-        super().__init__(parent)
+class WorkerSignals(QObject):
+    resultReadyOccurred = pyqtSignal(int, int, object)
+    errorOccurred = pyqtSignal(int, int, Exception)
+
+class WorkerTask(QRunnable):
+    def __init__(self, func: Callable[..., Any], iteration: int, slot: int, out: Dict[str, NPArrayT], signals: WorkerSignals) -> None:
+        super().__init__()
         self.__func = func
-    @pyqtSlot(int)
-    def compute(self, iteration: int) -> None:
+        self.__iteration = iteration
+        self.__slot = slot
+        self.__out = out
+        self.__signals = signals
+    def run(self) -> None:
         try:
-            result = self.__func(iteration).copy()
+            result = self.__func(self.__iteration, **self.__out)
+            for field, view in self.__out.items():
+                value = getattr(result, field)
+                if not np.shares_memory(value, view):
+                    np.copyto(view, np.reshape(value, view.shape))
         except Exception as e:
-            self.errorOccurred.emit(e)
+            self.__signals.errorOccurred.emit(self.__iteration, self.__slot, e)
             return
 
-        self.resultReadyOccurred.emit(result)
+        self.__signals.resultReadyOccurred.emit(self.__iteration, self.__slot, result)
+
+class Pacer:
+    def __init__(self, clock: Optional[Callable[[float], int]] = None) -> None:
+        self.__clock = clock
+        self.__iter: int = 0
+        self.__latency: float = 0.0
+        # iterations submitted before any finished wait for the pool to start up, so they are not measured
+        self.__warm: bool = False
+        self.__started: Dict[int, float] = {}
+        # iterations in the order they were submitted, so results are pushed in that order even with skipped ones
+        self.__order: Deque[int] = deque()
+    @property
+    def latency(self) -> float:
+        return self.__latency
+    def next(self) -> int:
+        # iterations that could only be finished after their time on the clock are skipped
+        now = time.monotonic()
+        iteration = self.__iter if self.__clock is None else max(self.__iter, self.__clock(now + self.__latency))
+        self.__iter = iteration + 1
+        if self.__warm:
+            self.__started[iteration] = now
+        self.__order.append(iteration)
+        return iteration
+    def done(self, iteration: int) -> None:
+        self.__warm = True
+        started = self.__started.pop(iteration, None)
+        if started is not None:
+            elapsed = time.monotonic() - started
+            self.__latency = elapsed if self.__latency == 0.0 else 0.8 * self.__latency + 0.2 * elapsed
+    def ready(self, pending: Dict[int, Any]) -> Optional[int]:
+        return self.__order.popleft() if self.__order and self.__order[0] in pending else None
+    def clear(self) -> None:
+        self.__started.clear()
+        self.__order.clear()
 
 class Worker(QObject):
     errorOccurred = pyqtSignal(Exception)
-    __requestOccurred = pyqtSignal(int)
-    def __init__(self, func: Callable[[int], Any], buffer: Buffer[Any], parent: Optional[QObject] = None) -> None:
+    def __init__(self, func: Callable[..., Any], buffer: SlabBuffer[Any], threads: int = 1,
+                 clock: Optional[Callable[[float], int]] = None, parent: Optional[QObject] = None) -> None:
+        if threads <= 0:
+            raise ValueError("Liczba wątków musi być większa od 0")
+
         super().__init__(parent)
 
+        self.__func = func
         self.__buffer = buffer
-        self.__iter: int = 0
-        self.__busy: bool = False
-
-        self.__thread = QThread(self)
-        self.__thread.setObjectName("WorkerThread")
-        self.__worker = WorkerThread(func)
-        self.__worker.moveToThread(self.__thread)
+        self.__threads = threads
+        self.__pacer = Pacer(clock)
+        self.__aborted: bool = False
 
-        self.__requestOccurred.connect(self.__worker.compute, Qt.ConnectionType.QueuedConnection)
+        # iterations submitted to the pool and finished iterations waiting for their predecessors
+        self.__tasks: Dict[int, WorkerTask] = {}
+        self.__pending: Dict[int, Optional[Tuple[int, Any]]] = {}
 
-        self.__worker.resultReadyOccurred.connect(self.__on_result)
-        self.__worker.errorOccurred.connect(self.__on_error)
+        self.__pool = QThreadPool(self)
+        self.__pool.setMaxThreadCount(threads)
+        self.__signals = WorkerSignals(self)
+        self.__signals.resultReadyOccurred.connect(self.__on_result)
+        self.__signals.errorOccurred.connect(self.__on_error)
 
-        self.__buffer.popOccurred.connect(self.__resume)
-        self.__buffer.clearOccurred.connect(self.__resume)
+        self.__buffer.popOccurred.connect(self.__step)
+        self.__buffer.clearOccurred.connect(self.__step)
 
-        self.__thread.start()
         self.__step()
-    def __resume(self) -> None:
-        if not self.__busy: self.__step()
+    @property
+    def threads(self) -> int:
+        return self.__threads
+    @property
+    def latency(self) -> float:
+        return self.__pacer.latency
     def __step(self) -> None:
-        if len(self.__buffer) >= self.__buffer.capacity:
-            self.__busy = False
-            return
+        # frames are computed straight into free slots of the buffer, so running out of slots is the back-pressure
+        while not self.__aborted and len(self.__tasks) < self.__threads:
+            slot = self.__buffer.acquire()
+            if slot is None: return
+
+            iteration = self.__pacer.next()
+            task = WorkerTask(self.__func, iteration, slot, self.__buffer.slot(slot), self.__signals)
+            task.setAutoDelete(False)
+            self.__tasks[iteration] = task
+            self.__pool.start(task)
+    def __flush(self) -> None:
+        while (iteration := self.__pacer.ready(self.__pending)) is not None:
+            value = self.__pending.pop(iteration)
+            if value is not None:
+                self.__buffer.push(*value, key=iteration)
+    @pyqtSlot(int, int, object)
+    def __on_result(self, iteration: int, slot: int, value: Any) -> None:
+        if self.__aborted: return
 
-        self.__busy = True
-        self.__requestOccurred.emit(self.__iter)
-        self.__iter += 1
-    @pyqtSlot(object)
-    def __on_result(self, value: NPArrayT) -> None:
-        self.__buffer.push(value)
+        self.__tasks.pop(iteration, None)
+        self.__pacer.done(iteration)
+        self.__pending[iteration] = (slot, value)
+        self.__flush()
         self.__step()
-    @pyqtSlot(Exception)
-    def __on_error(self, error: Exception) -> None:
+    @pyqtSlot(int, int, Exception)
+    def __on_error(self, iteration: int, slot: int, error: Exception) -> None:
+        if self.__aborted: return
+
+        # a failed frame is skipped, so it does not hold back the frames after it
+        self.__tasks.pop(iteration, None)
+        self.__pacer.done(iteration)
+        self.__buffer.discard(slot)
+        self.__pending[iteration] = None
+        self.__flush()
         self.errorOccurred.emit(error)
+        self.__step()
     def abort(self) -> None:
-        self.__busy = True
+        self.__aborted = True
 
         try:
-            self.__buffer.popOccurred.disconnect(self.__resume)
-            self.__buffer.clearOccurred.disconnect(self.__resume)
+            self.__buffer.popOccurred.disconnect(self.__step)
+            self.__buffer.clearOccurred.disconnect(self.__step)
         except TypeError: pass
 
         try:
-            self.__requestOccurred.disconnect()
+            self.__signals.resultReadyOccurred.disconnect(self.__on_result)
+            self.__signals.errorOccurred.disconnect(self.__on_error)
         except TypeError: pass
 
+        self.__pool.clear()
+        self.__pool.waitForDone()
+        self.__tasks.clear()
+        self.__pending.clear()
+        self.__pacer.clear()
+
+class ProcessWorker(QObject):
+    errorOccurred = pyqtSignal(Exception)
+    def __init__(self, func: Callable[..., Any], buffer: SlabBuffer[Any], pool: SharedPool, processes: int = 1,
+                 arg: Optional[Callable[[int], Any]] = None, clock: Optional[Callable[[float], int]] = None,
+                 parent: Optional[QObject] = None) -> None:
+        if processes <= 0:
+            raise ValueError("Liczba procesów musi być większa od 0")
+
+        slab = {field: (pool.name(arr), arr.shape, arr.dtype.str) for field, arr in buffer.slab.items()}
+        if any(name is None for name, _, _ in slab.values()):
+            raise ValueError("Bufor klatek nie znajduje się w pamięci współdzielonej")
+
+        super().__init__(parent)
+
+        self.__buffer = buffer
+        self.__pool = pool
+        self.__processes = processes
+        self.__arg = arg
+        self.__pacer = Pacer(clock)
+        self.__aborted: bool = False
+
+        self.__tasks: Dict[int, Future] = {}
+        self.__pending: Dict[int, Optional[int]] = {}
+
+        # the processes attach to the precomputed arrays of the frame function and to the slab of the buffer
+        data = self.__pool.dumps(func)
+        self.__executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                              initializer=init_worker, initargs=(data, slab))
+        self.__signals = WorkerSignals(self)
+        self.__signals.resultReadyOccurred.connect(self.__on_result, Qt.ConnectionType.QueuedConnection)
+
+        self.__buffer.popOccurred.connect(self.__step)
+        self.__buffer.clearOccurred.connect(self.__step)
+
+        self.__step()
+    @property
+    def processes(self) -> int:
+        return self.__processes
+    @property
+    def latency(self) -> float:
+        return self.__pacer.latency
+    def __map(self, iteration: int) -> Any:
+        return iteration if self.__arg is None else self.__arg(iteration)
+    def __step(self) -> None:
+        while not self.__aborted and len(self.__tasks) < self.__processes:
+            slot = self.__buffer.acquire()
+            if slot is None: return
+
+            iteration = self.__pacer.next()
+            future = self.__executor.submit(run_worker, self.__map(iteration), slot)
+            self.__tasks[iteration] = future
+            future.add_done_callback(functools.partial(self.__done, iteration, slot))
+    def __done(self, iteration: int, slot: int, future: Future) -> None:
+        # called on a thread of the executor or, for an already finished future, right away on the calling one
+        if not self.__aborted:
+            self.__signals.resultReadyOccurred.emit(iteration, slot, future)
+    def __flush(self) -> None:
+        while (iteration := self.__pacer.ready(self.__pending)) is not None:
+            slot = self.__pending.pop(iteration)
+            if slot is not None:
+                self.__buffer.push(slot, key=iteration)
+    @pyqtSlot(int, int, object)
+    def __on_result(self, iteration: int, slot: int, future: Future) -> None:
+        if self.__aborted: return
+
+        self.__tasks.pop(iteration, None)
+        self.__pacer.done(iteration)
+        error = future.exception()
+        if error is not None:
+            self.__buffer.discard(slot)
+            self.__pending[iteration] = None
+            self.__flush()
+            self.errorOccurred.emit(error)
+            self.__step()
+            return
+
+        self.__pending[iteration] = slot
+        self.__flush()
+        self.__step()
+    def abort(self) -> None:
+        self.__aborted = True
+
         try:
-            self.__worker.resultReadyOccurred.disconnect(self.__on_result)
-            self.__worker.errorOccurred.disconnect(self.__on_error)
+            self.__buffer.popOccurred.disconnect(self.__step)
+            self.__buffer.clearOccurred.disconnect(self.__step)
         except TypeError: pass
 
-        if self.__thread.isRunning():
-            self.__thread.quit()
-            self.__thread.wait()
+        try:
+            self.__signals.resultReadyOccurred.disconnect(self.__on_result)
+        except TypeError: pass
 
-        self.__worker.deleteLater()
-        self.__thread.deleteLater()
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+        self.__tasks.clear()
+        self.__pending.clear()
+        self.__pacer.clear()
+        self.__pool.close()
 
-__all__ = ['Worker']
+__all__ = ['Worker', 'ProcessWorker']
@@ -0,0 +1,40 @@
+# python internals
+import os
+import subprocess
+import sys
+# external packages
+import pytest
+
+# widgets are never shown, so the tests render without a display through surfaceless EGL (Mesa), with PyOpenGL resolving
+# through EGL as well; offscreen is the fallback, on which the GL tests skip
+HEADLESS_GL = {"QT_QPA_PLATFORM": "eglfs", "QT_QPA_EGLFS_INTEGRATION": "none", "EGL_PLATFORM": "surfaceless",
+               "QT_QPA_EGLFS_FB": "/dev/null", "PYOPENGL_PLATFORM": "egl"}
+PROBE = """
+from PyQt6.QtGui import QGuiApplication, QOpenGLContext, QOffscreenSurface
+from OpenGL import GL
+app = QGuiApplication([])
+context, surface = QOpenGLContext(), QOffscreenSurface()
+assert context.create()
+surface.setFormat(context.format())
+surface.create()
+assert context.makeCurrent(surface) and GL.glGetString(GL.GL_VERSION)
+"""
+
+def _headless_gl() -> bool:
+    # a platform failing to start aborts the whole process, so it is tried in a child first
+    try:
+        return subprocess.run([sys.executable, "-c", PROBE], env={**os.environ, **HEADLESS_GL},
+                              capture_output=True, timeout=60).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+if "QT_QPA_PLATFORM" not in os.environ:
+    os.environ.update(HEADLESS_GL if _headless_gl() else {"QT_QPA_PLATFORM": "offscreen"})
+if os.environ["QT_QPA_PLATFORM"] in ("eglfs", "minimalegl"):
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def app():
+    from PyQt6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
@@ -0,0 +1,41 @@
+# internal packages
+from src.ntypes import NPUintT, Scatter, Volume, EqualAreaDims
+from src.model import Atom, State, StateSpec, Plotter
+from src.color import ColorScale, Colorizer, DensityEncoder
+# external packages
+import numpy as np
+import pyqtgraph as pg
+import pytest
+
+CMAP = pg.colormap.get('plasma')
+
+def test_curve_is_relative_to_the_scale():
+    val = np.linspace(0.0, 1.0, 101)
+    colors = [Colorizer(CMAP, ColorScale(), dtype=NPUintT)(val * factor) for factor in (1.0, 1e-8)]
+    assert np.array_equal(colors[0], colors[1])
+    np.testing.assert_allclose(ColorScale(1e-8).normalize(val * 1e-8), ColorScale(1.0).normalize(val))
+
+def test_cutoff_hides_what_masking_drops():
+    val = np.random.default_rng(0).exponential(size=10000) ** 4
+    color = Colorizer(CMAP, ColorScale(), dtype=NPUintT, cutoff=0.001)(val)
+    shown = Scatter(np.zeros((len(val), 3)), val).masked(0.001)
+    assert np.count_nonzero(color[:, 3]) == len(shown.val)
+    assert np.all(color[val > val.max() * 0.001, 3] == 255)
+
+@pytest.mark.parametrize("specs", (((3, 2, 0), (2, 1, 0)), ((2, 1, 1), (3, 1, 1), (3, 2, 1))))
+def test_fixed_point_set_shows_every_masked_point(specs):
+    # the peak falls below its first value in later frames, which must neither lose points nor show extra ones
+    plotter = Plotter(Atom(*(State(StateSpec(*spec)) for spec in specs)), EqualAreaDims(30, 30), 'cross')
+    full, fixed = plotter.scatter(), plotter.scatter(stable=True)
+    colorizer = Colorizer(CMAP, ColorScale(), dtype=NPUintT, cutoff=0.001)
+    for t in np.linspace(0.0, 40.0, 9):
+        masked = full.val(t).masked(0.001)
+        frame = colorizer.frame(fixed.val(t))
+        assert np.count_nonzero(frame.color[:, 3]) == len(masked.val)
+
+def test_density_encoder_is_relative_to_the_scale():
+    val = np.linspace(0.0, 2e-9, 64).reshape(4, 4, 4)
+    for dtype, top in ((np.float16, 1.0), (NPUintT, 255)):
+        vl = DensityEncoder(ColorScale(), dtype).frame(Volume(val))
+        assert vl.vmax[0] == pytest.approx(val.max(), rel=1e-6)
+        assert vl.color.dtype == np.dtype(dtype) and vl.color.max() == top
@@ -0,0 +1,178 @@
+# internal packages
+from src.ntypes import NPUintT, Volume
+from src.color import ColorScale, DensityEncoder
+from src.bricks import BrickGrid
+from src.items import ScatterItem, VolumeItem
+# external packages
+import numpy as np
+import pyqtgraph as pg
+import pytest
+
+SIZE = 64
+
+class Canvas:
+    # an offscreen framebuffer the items paint into through the camera of a view that is never shown
+    def __init__(self) -> None:
+        from PyQt6.QtGui import QOpenGLContext, QOffscreenSurface
+        from PyQt6.QtOpenGL import QOpenGLFramebufferObject, QOpenGLFramebufferObjectFormat, QOpenGLVertexArrayObject
+        import pyqtgraph.opengl as gl
+
+        self.context = QOpenGLContext()
+        if not self.context.create():
+            pytest.skip("Nie można utworzyć kontekstu OpenGL")
+        self.surface = QOffscreenSurface()
+        self.surface.setFormat(self.context.format())
+        self.surface.create()
+        if not self.context.makeCurrent(self.surface):
+            pytest.skip("Nie można aktywować kontekstu OpenGL")
+
+        fmt = QOpenGLFramebufferObjectFormat()
+        fmt.setAttachment(QOpenGLFramebufferObject.Attachment.CombinedDepthStencil)
+        self.fbo = QOpenGLFramebufferObject(SIZE, SIZE, fmt)
+        self.fbo.bind()
+        # core profiles draw nothing without a bound vertex array
+        self.vao = QOpenGLVertexArrayObject()
+        self.vao.create()
+        self.vao.bind()
+
+        self.view = gl.GLViewWidget()
+        self.view.resize(SIZE, SIZE)
+    def paint(self, item) -> np.ndarray:
+        from OpenGL import GL
+
+        GL.glViewport(0, 0, SIZE, SIZE)
+        self.view.setProjection((0, 0, SIZE, SIZE), (0, 0, SIZE, SIZE))
+        self.view.setModelview()
+        GL.glClearColor(0.0, 0.0, 0.0, 1.0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+        item.paint()
+        GL.glFinish()
+
+        image = self.fbo.toImage()
+        image = image.convertToFormat(image.Format.Format_RGBA8888)
+        return np.frombuffer(image.constBits().asstring(image.sizeInBytes()), dtype=np.uint8).reshape(SIZE, SIZE, 4)[..., :3].copy()
+    def close(self) -> None:
+        self.vao.destroy()
+        self.fbo.release()
+        self.context.doneCurrent()
+
+@pytest.fixture
+def canvas(app):
+    canvas = Canvas()
+    yield canvas
+    canvas.close()
+
+def _cloud(n: int = 2000) -> np.ndarray:
+    return np.random.default_rng(0).normal(scale=3.0, size=(n, 3)).astype(np.float32)
+
+def _lit(pixels: np.ndarray) -> np.ndarray:
+    return np.any(pixels > 0, axis=-1)
+
+def test_scatter_paints_colored_points(canvas):
+    pos = _cloud()
+    item = ScatterItem(pos=pos, color=np.tile(np.array([[255, 128, 0, 255]], dtype=NPUintT), (len(pos), 1)), size=4.0)
+    canvas.view.addItem(item)
+    canvas.view.setCameraPosition(distance=20)
+
+    pixels = canvas.paint(item)
+    lit = _lit(pixels)
+    assert np.count_nonzero(lit) > 100
+    assert np.allclose(pixels[lit].max(axis=0), (255, 128, 0), atol=2)
+    assert np.all(pixels[lit][:, 2] == 0)
+
+def test_scatter_streams_colors(canvas):
+    pos = _cloud()
+    item = ScatterItem(pos=pos, color=np.tile(np.array([[255, 0, 0, 255]], dtype=NPUintT), (len(pos), 1)), size=4.0)
+    canvas.view.addItem(item)
+    canvas.view.setCameraPosition(distance=20)
+
+    first = canvas.paint(item)
+    # the new colors go into the other buffer, the points stay where they were
+    for color in ((0, 255, 0, 255), (0, 0, 255, 255)):
+        item.set_colors(np.tile(np.array([color], dtype=NPUintT), (len(pos), 1)))
+        pixels = canvas.paint(item)
+        assert np.array_equal(_lit(pixels), _lit(first))
+        assert np.allclose(pixels[_lit(pixels)].max(axis=0), color[:3], atol=2)
+
+def test_scatter_float_colors_and_options(canvas):
+    pos = _cloud()
+    item = ScatterItem(pos=pos, color=np.tile(np.array([[0.0, 0.0, 1.0, 1.0]]), (len(pos), 1)), size=2.0)
+    canvas.view.addItem(item)
+    canvas.view.setCameraPosition(distance=20)
+
+    small = np.count_nonzero(_lit(canvas.paint(item)))
+    item.size = 6.0
+    item.set_blending('opaque')
+    pixels = canvas.paint(item)
+    assert np.count_nonzero(_lit(pixels)) > small
+    assert np.allclose(pixels[_lit(pixels)].max(axis=0), (0, 0, 255), atol=2)
+
+    # transparent points are left out whatever the blending
+    color = np.tile(np.array([[0, 0, 255, 255]], dtype=NPUintT), (len(pos), 1))
+    color[::2, 3] = 0
+    item.set_colors(color)
+    assert np.count_nonzero(_lit(canvas.paint(item))) < np.count_nonzero(_lit(pixels))
+
+    with pytest.raises(ValueError):
+        item.size = 0.0
+    with pytest.raises(ValueError):
+        item.set_colors(np.zeros((len(pos) + 1, 4), dtype=NPUintT))
+
+def _density(n: int = 32) -> np.ndarray:
+    x = np.linspace(-1.0, 1.0, n)
+    r2 = x[:, None, None] ** 2 + x[None, :, None] ** 2 + x[None, None, :] ** 2
+    return np.exp(-4.0 * r2)
+
+def _volume(canvas, val: np.ndarray, dtype: np.dtype = np.float16, bricks: bool = False):
+    vl = DensityEncoder(ColorScale(), dtype).frame(Volume(val, bricks=BrickGrid(val.shape, 8).stats(val) if bricks else None))
+    item = VolumeItem(vl.color, pg.colormap.get('plasma'), float(vl.vmax[0]), brick=8)
+    item.setData(vl.color, vmax=float(vl.vmax[0]), bricks=vl.bricks)
+    canvas.view.addItem(item)
+    canvas.view.setCameraPosition(pos=pg.Vector(*[x / 2.0 for x in val.shape]), distance=3.0 * val.shape[0])
+    return item
+
+def test_volume_paints_whatever_the_magnitude(canvas):
+    # normalized states of high quantum numbers hold densities far below the smallest normal float16
+    images = [canvas.paint(_volume(canvas, _density() * factor)) for factor in (1.0, 1e-9)]
+    assert np.count_nonzero(_lit(images[0])) > 100
+    assert np.abs(images[0].astype(int) - images[1].astype(int)).max() <= 2
+
+def test_volume_rescales_through_a_uniform(canvas):
+    item = _volume(canvas, _density())
+    bright = canvas.paint(item)
+    item.set_scale(item.scale * 10.0)
+    dim = canvas.paint(item)
+    assert 0 < dim.astype(int).sum() < bright.astype(int).sum()
+
+    # an empty frame is encoded against a zero range and draws nothing
+    empty = DensityEncoder(ColorScale()).frame(Volume(np.zeros_like(_density())))
+    item.setData(empty.color, vmax=float(empty.vmax[0]))
+    assert not np.any(canvas.paint(item))
+
+def test_volume_encodings_agree(canvas):
+    half = canvas.paint(_volume(canvas, _density())).astype(int)
+    byte = canvas.paint(_volume(canvas, _density(), NPUintT)).astype(int)
+    # bytes round the faintest densities away, so only the rims differ
+    assert not np.any(_lit(byte) & ~_lit(half))
+    assert abs(byte.sum() - half.sum()) < 0.05 * half.sum()
+    assert np.mean(np.abs(half - byte)) < 2.0
+
+def test_volume_reuploads_when_the_range_changes(canvas):
+    val = _density()
+    item = _volume(canvas, val, bricks=True)
+    canvas.paint(item)
+
+    # the same densities encoded against a grown scale leave every brick statistic as it was
+    scale = ColorScale(val.max() * 4.0)
+    vl = DensityEncoder(scale).frame(Volume(val, bricks=BrickGrid(val.shape, 8).stats(val)))
+    item.set_scale(scale.value)
+    item.setData(vl.color, vmax=float(vl.vmax[0]), bricks=vl.bricks)
+    pixels = canvas.paint(item)
+
+    fresh = _volume(canvas, val)
+    fresh.set_scale(scale.value)
+    canvas.view.removeItem(item)
+    assert np.abs(pixels.astype(int) - canvas.paint(fresh).astype(int)).max() <= 2
+
+    with pytest.raises(ValueError):
+        item.setData(vl.color, vmax=-1.0)
@@ -0,0 +1,50 @@
+# internal packages
+from src.model import Atom, State, StateSpec, Plotter
+from src.ntypes import SphDims, EqualAreaDims
+# external packages
+import numpy as np
+import pytest
+
+# single precision keeps densities within a few float32 ulps of the peak, measured at 3e-7 to 2e-6
+RTOL = 1e-5
+SPECS = ((3, 2, 1), (2, 1, 0), (4, 3, -2), (5, 2, 2))
+OUTPUTS = {
+    'scatter': lambda plotter: plotter.scatter(stable=True),
+    'trilinear': lambda plotter: plotter.volume('trilinear'),
+    'operator': lambda plotter: plotter.volume('trilinear', 'operator'),
+    'native': lambda plotter: plotter.volume('native'),
+}
+
+@pytest.fixture(scope="module")
+def plotters():
+    # plotters are shared between the outputs, as their setup dominates the run time
+    cache = {}
+    def plotter(grid, mode, precision):
+        key = (grid, mode, precision)
+        if key not in cache:
+            atom = Atom(*(State(StateSpec(*spec)) for spec in SPECS))
+            cache[key] = Plotter(atom, grid(40, 40), mode, radial='probability', precision=precision)
+        return cache[key]
+    return plotter
+
+@pytest.mark.parametrize("grid", (SphDims, EqualAreaDims))
+@pytest.mark.parametrize("mode", ('direct', 'cross', 'basis'))
+@pytest.mark.parametrize("output", tuple(OUTPUTS))
+def test_single_matches_double(plotters, grid, mode, output):
+    single, double = (OUTPUTS[output](plotters(grid, mode, precision)).val(0.7) for precision in ('single', 'double'))
+
+    assert single.val.dtype == np.float32
+    assert double.val.dtype == np.float64
+    assert single.val.shape == double.val.shape
+    if output == 'scatter':
+        assert single.pos.dtype == np.float32
+        np.testing.assert_allclose(single.pos, double.pos, rtol=0.0, atol=RTOL * np.abs(double.pos).max())
+
+    # densities near zero carry no relative precision, so the error is taken relative to the peak
+    peak = np.max(double.val)
+    assert peak > 0.0
+    np.testing.assert_allclose(single.val, double.val, rtol=0.0, atol=RTOL * peak)
+
+def test_unknown_precision():
+    with pytest.raises(ValueError):
+        Plotter(Atom(State(StateSpec(2, 1, 0))), SphDims(10, 10), precision='half')
@@ -0,0 +1,60 @@
+# python internals
+import threading
+import time
+# internal packages
+from src.quality import LevelBuilder
+# external packages
+import pytest
+
+def _wait(app, until, timeout: float = 5.0) -> None:
+    end = time.monotonic() + timeout
+    while not until() and time.monotonic() < end:
+        app.processEvents()
+        time.sleep(0.005)
+
+def test_levels_are_built_in_the_background(app):
+    main = threading.current_thread()
+    threads = {}
+    def build(level):
+        threads[level] = threading.current_thread()
+        return level * 10
+
+    levels = LevelBuilder(build, 4)
+    assert levels.build(0) == 0 and levels.ready == 1
+    ready = []
+    levels.levelReadyOccurred.connect(ready.append)
+    levels.start()
+    _wait(app, lambda: levels.ready == 4)
+
+    # finer levels are always ready before coarser ones, and only the first one is built on the calling thread
+    assert ready == [1, 2, 3]
+    assert [levels[level] for level in range(4)] == [0, 10, 20, 30]
+    assert threads[0] is main and all(threads[level] is not main for level in (1, 2, 3))
+
+def test_aborted_levels_are_dropped(app):
+    started = threading.Event()
+    def build(level):
+        started.set()
+        time.sleep(0.05)
+        return level
+
+    levels = LevelBuilder(build, 3)
+    levels.start()
+    started.wait(1.0)
+    levels.abort()
+    time.sleep(0.1)
+    _wait(app, lambda: False, 0.1)
+    assert levels.ready == 0
+
+def test_errors_reach_the_calling_thread(app):
+    def build(level):
+        raise ValueError("poziom")
+
+    levels = LevelBuilder(build, 2)
+    errors = []
+    levels.errorOccurred.connect(lambda error: errors.append((error, threading.current_thread())))
+    levels.start()
+    _wait(app, lambda: bool(errors))
+    assert isinstance(errors[0][0], ValueError) and errors[0][1] is threading.current_thread()
+    with pytest.raises(ValueError):
+        LevelBuilder(build, 0)